@@ -7,3 +7,43 @@ from django.conf import settings
 
 
 EXAMPLE_SETTING_ONE = getattr(settings, "EXAMPLE_SETTING_ONE", None)
+
+# Seconds rendered charts of a closed month stay cached
+LAWN_STATS_CHART_CACHE_TIMEOUT = getattr(
+    settings, "LAWN_STATS_CHART_CACHE_TIMEOUT", 60 * 60 * 24 * 30
+)
+
+# Seconds rendered charts of the current month stay cached
+LAWN_STATS_CURRENT_MONTH_CACHE_TIMEOUT = getattr(
+    settings, "LAWN_STATS_CURRENT_MONTH_CACHE_TIMEOUT", 60 * 15
+)
+
+# Processes used to render the charts of a section, 1 renders them in-process
+LAWN_STATS_CHART_WORKERS = getattr(settings, "LAWN_STATS_CHART_WORKERS", 1)
+
+# Rows turned into Python objects at a time while reading the AFAT fats of a
+# month, the MySQL driver still buffers the whole result
+LAWN_STATS_AFAT_CHUNK_SIZE = getattr(settings, "LAWN_STATS_AFAT_CHUNK_SIZE", 2000)
+
+# Seconds after which CSV uploads that were never processed are deleted
+LAWN_STATS_CSV_UPLOAD_MAX_AGE = getattr(
+    settings, "LAWN_STATS_CSV_UPLOAD_MAX_AGE", 60 * 60 * 24
+)
+
+# Seconds resolved character and account identities stay cached
+LAWN_STATS_IDENTITY_CACHE_TIMEOUT = getattr(
+    settings, "LAWN_STATS_IDENTITY_CACHE_TIMEOUT", 60 * 60
+)
+
+# Identities kept in memory by every process on top of the Django cache
+LAWN_STATS_IDENTITY_LRU_SIZE = getattr(settings, "LAWN_STATS_IDENTITY_LRU_SIZE", 50000)
+
+# Days at the start of a month the periodic update also updates the previous
+# month, for fats added late to its fleets
+LAWN_STATS_PREVIOUS_MONTH_UPDATE_DAYS = getattr(
+    settings, "LAWN_STATS_PREVIOUS_MONTH_UPDATE_DAYS", 3
+)
+
+# Day ranges a month's AFAT data is split into, every range is counted by
+# its own celery task. 1 processes the month in a single task
+LAWN_STATS_AFAT_SHARDS = getattr(settings, "LAWN_STATS_AFAT_SHARDS", 1)
@@ -13,3 +13,6 @@ class ExampleConfig(AppConfig):
     name = "lawn_stats"
     label = "lawn_stats"
     verbose_name = f"lawn_stats App v{__version__}"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,150 @@
+"""Cache for rendered charts"""
+
+import hashlib
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .app_settings import (
+    LAWN_STATS_CHART_CACHE_TIMEOUT,
+    LAWN_STATS_CURRENT_MONTH_CACHE_TIMEOUT,
+)
+
+logger = get_extension_logger(__name__)
+
+
+def _version_key(month, year):
+    return f"lawn_stats:data_version:{year}:{month:02d}"
+
+
+def _chart_key(name, month, year, version):
+    return f"lawn_stats:chart:{year}:{month:02d}:{name}:{version}"
+
+
+def _image_key(name, chart, month, year, version):
+    # Chart names can be corporation names, which aren't valid in cache keys
+    chart = hashlib.md5(chart.encode()).hexdigest()
+    return f"lawn_stats:chart:{year}:{month:02d}:{name}:{chart}:{version}"
+
+
+def _months_back(month, year, months):
+    """Return (month, year) of the given month and the months - 1 before it"""
+    for _ in range(months):
+        yield month, year
+        month -= 1
+        if month == 0:
+            month = 12
+            year -= 1
+
+
+def bump_data_version(month, year):
+    """
+    Mark the stats of a month as changed
+
+    Called by the ingestion tasks after they wrote stats for the month,
+    charts cached for an older version are never read again.
+    """
+    cache.set(_version_key(month, year), time.time_ns(), None)
+
+
+def data_version(month, year, months=1):
+    """
+    Version stamp of the stats of a month and the months - 1 before it
+
+    The stamp is the newest of the month versions, so it changes whenever
+    one of them is bumped.
+    Months without a version, e.g. after the cache was cleared, get a new one.
+    """
+    keys = [_version_key(*period) for period in _months_back(month, year, months)]
+    versions = cache.get_many(keys)
+
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+
+    return max(versions.values())
+
+
+def get_chart(name, month, year, months=1):
+    """
+    Return the cached section for the current data version or None
+
+    PNG images of the section are replaced by True, or False if the chart
+    is empty, load them with get_image.
+    """
+    return cache.get(_chart_key(name, month, year, data_version(month, year, months)))
+
+
+def get_image(name, chart, month, year, months=1):
+    """Return the cached PNG of one chart of a section or None"""
+    return cache.get(
+        _image_key(name, chart, month, year, data_version(month, year, months))
+    )
+
+
+def claim_render(name, month, year, months=1):
+    """
+    Return True if the caller should queue rendering the chart
+
+    Only the first caller per data version gets True, so page loads while
+    the render task runs don't queue it again. The claim runs out after a
+    few minutes in case the task got lost.
+    """
+    version = data_version(month, year, months)
+    return cache.add(
+        f"lawn_stats:rendering:{year}:{month:02d}:{name}:{version}", True, 300
+    )
+
+
+def get_or_render(name, month, year, render, months=1):
+    """
+    Return the cached result of render(month, year) for the current data version,
+    rendering and caching it on a miss
+
+    PNG images in the result are cached under their own keys, so a chart
+    image request doesn't load the whole section. The section itself only
+    keeps whether each chart has an image, see get_chart.
+
+    :param name: chart name, unique per month
+    :param months: number of months the chart looks back, including the month itself
+    """
+    version = data_version(month, year, months)
+    key = _chart_key(name, month, year, version)
+    result = cache.get(key)
+
+    if result is None:
+        started = time.perf_counter()
+        result = render(month, year)
+
+        now = datetime.now()
+        if (year, month) >= (now.year, now.month):
+            timeout = LAWN_STATS_CURRENT_MONTH_CACHE_TIMEOUT
+        else:
+            timeout = LAWN_STATS_CHART_CACHE_TIMEOUT
+
+        images = {chart: png for chart, png in result.items() if isinstance(png, bytes)}
+        if images:
+            cache.set_many(
+                {
+                    _image_key(name, chart, month, year, version): png
+                    for chart, png in images.items()
+                    if png
+                },
+                timeout,
+            )
+            result = {
+                chart: bool(images[chart]) if chart in images else value
+                for chart, value in result.items()
+            }
+        # Written after the images, a cached section means its images are there
+        cache.set(key, result, timeout)
+
+        logger.info(
+            f"Rendered {name} for {month}/{year} in {time.perf_counter() - started:.2f}s"
+        )
+
+    return result
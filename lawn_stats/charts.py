@@ -0,0 +1,654 @@
+"""Chart rendering for the all_charts sections"""
+
+import calendar
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from django.conf import settings
+from django.db.models import Q, Sum
+
+from allianceauth.services.hooks import get_extension_logger
+
+from . import renderers
+from .app_settings import LAWN_STATS_CHART_WORKERS
+from .models import (
+    AuthenticationUserprofile,
+    AuthUser,
+    EveonlineEveallianceinfo,
+    EveonlineEvecorporationinfo,
+    MonthlyCorpMembership,
+    MonthlyCorpStats,
+    MonthlyCorpTotals,
+    MonthlyCreatorStats,
+    MonthlyFleetType,
+    MonthlyUserStats,
+    month_period,
+)
+
+logger = get_extension_logger(__name__)
+
+months_to_display = 5
+
+
+def _render(specs):
+    """
+    Render chart specs to PNG bytes
+
+    The charts are drawn in parallel when LAWN_STATS_CHART_WORKERS is above 1,
+    and one after another otherwise. Inside a Celery prefork worker, which
+    can't have child processes, they are always drawn one after another,
+    the sections of a month are rendered by separate tasks instead.
+
+    :param specs: list of (name, renderer, kwargs)
+    :return: {name: png}
+    """
+    started = time.perf_counter()
+    if (
+        LAWN_STATS_CHART_WORKERS <= 1
+        or len(specs) <= 1
+        or multiprocessing.current_process().daemon
+    ):
+        charts = {name: render(**kwargs) for name, render, kwargs in specs}
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(LAWN_STATS_CHART_WORKERS, len(specs))
+        ) as executor:
+            futures = {
+                name: executor.submit(render, **kwargs)
+                for name, render, kwargs in specs
+            }
+            charts = {name: future.result() for name, future in futures.items()}
+
+    logger.debug(
+        f"Rendered {len(charts)} charts in {time.perf_counter() - started:.2f}s"
+    )
+    return charts
+
+
+def _running_average(totals):
+    """Return the running average over 3 months of the totals"""
+    return pd.Series(list(totals)).rolling(window=3, min_periods=1).mean().tolist()
+
+
+def _trend_months(month, year):
+    """Return the (year, month) pairs of the trend charts, oldest first"""
+    index = year * 12 + month - 1
+    return [(i // 12, i % 12 + 1) for i in range(index - months_to_display, index + 1)]
+
+
+def _period_range(date_range):
+    """Return the first and last period of the given (year, month) pairs"""
+    (first_year, first_month), (last_year, last_month) = date_range[0], date_range[-1]
+    return month_period(first_month, first_year), month_period(last_month, last_year)
+
+
+def _creator_names(creator_ids):
+    """
+    Return the display names of fleet creators by user id
+
+    That is the name of the main character, or the username for users
+    without a main.
+    """
+    names = {
+        user_id: character_name or username
+        for user_id, character_name, username in AuthenticationUserprofile.objects.filter(
+            user_id__in=creator_ids
+        ).values_list(
+            "user_id", "main_character__character_name", "user__username"
+        )
+    }
+    missing = set(creator_ids) - names.keys()
+    if missing:
+        # Users without a profile, or deleted ones
+        names.update(
+            AuthUser.objects.filter(pk__in=missing).values_list("pk", "username")
+        )
+        for creator_id in missing - names.keys():
+            names[creator_id] = f"User {creator_id}"
+    return names
+
+
+def creator_chart_specs(month, year):
+    # Query data from MonthlyCreatorStats
+    stats = MonthlyCreatorStats.objects.filter(period=month_period(month, year))
+    fleet_types = MonthlyFleetType.objects.filter(
+        source="afat", period=month_period(month, year)
+    )
+
+    month_name = datetime(year, month, 1).strftime("%B")
+
+    rows = list(
+        stats.values_list(
+            "creator_id", "fleet_type__source", "fleet_type__name", "total_created"
+        )
+    )
+    creator_names = _creator_names({row[0] for row in rows})
+
+    creators = list(dict.fromkeys(creator_names[row[0]] for row in rows))
+    creator_index = {creator: i for i, creator in enumerate(creators)}
+    data = {fleet_type.name: [0] * len(creators) for fleet_type in fleet_types}
+    for creator_id, source, fleet_name, total_created in rows:
+        if source == "afat":
+            data[fleet_name][creator_index[creator_names[creator_id]]] += total_created
+
+    df = pd.DataFrame(data, index=creators)
+    df = df.sort_index()
+
+    specs = []
+
+    if not df.empty:
+        # Remove columns with all zeros
+        df = df.loc[:, (df != 0).any(axis=0)]
+
+        if not df.empty:
+            specs.append(
+                (
+                    "bar_chart",
+                    renderers.creator_bar_chart,
+                    {
+                        "index": list(df.index),
+                        "columns": {
+                            column: df[column].tolist() for column in df.columns
+                        },
+                        "title": f"Fleet Types By FC for {month_name} {year}",
+                    },
+                )
+            )
+
+        total_created_by_fleet = (
+            stats.filter(fleet_type__source="afat")
+            .values("fleet_type__name")
+            .annotate(total_created=Sum("total_created"))
+            .order_by("fleet_type__name")
+        )
+        fleet_types = [item["fleet_type__name"] for item in total_created_by_fleet]
+        proportions = [item["total_created"] for item in total_created_by_fleet]
+
+        if proportions:
+            specs.append(
+                (
+                    "pie_chart",
+                    renderers.creator_pie_chart,
+                    {
+                        "labels": fleet_types,
+                        "values": proportions,
+                        "title": f"Fleet Type Proportions for {month_name} {year}",
+                    },
+                )
+            )
+
+    # Line chart for total fleets of each type each month
+    date_range = _trend_months(month, year)
+
+    monthly_totals = (
+        MonthlyCreatorStats.objects.filter(period__range=_period_range(date_range))
+        .values("month", "year", "fleet_type__name")
+        .annotate(total_fleets=Sum("total_created"))
+        .order_by("year", "month", "fleet_type__name")
+    )
+
+    fleet_type_names = {item["fleet_type__name"] for item in monthly_totals}
+    line_data = {name: [0] * len(date_range) for name in fleet_type_names}
+    for item in monthly_totals:
+        fleet_name = item["fleet_type__name"]
+        date_index = next(
+            (
+                i
+                for i, date in enumerate(date_range)
+                if date[1] == item["month"] and date[0] == item["year"]
+            ),
+            None,
+        )
+        if date_index is not None:
+            line_data[fleet_name][date_index] = item["total_fleets"]
+
+    if line_data:
+        specs.append(
+            (
+                "line_chart",
+                renderers.creator_line_chart,
+                {
+                    "date_range": date_range,
+                    "series": line_data,
+                    "title": f"Month Over Month Fleet Types for {year}",
+                },
+            )
+        )
+
+    return specs
+
+
+def creator_charts(month, year):
+    # Missing charts are shown as empty
+    return {
+        "bar_chart": b"",
+        "pie_chart": b"",
+        "line_chart": b"",
+        **_render(creator_chart_specs(month, year)),
+    }
+
+
+def _source_matrix(stats, source, rows, fleet_names):
+    """Pivot stats of one source into a row x fleet type frame"""
+    frame = stats[stats["source"] == source]
+    matrix = frame.pivot_table(
+        index="row", columns="fleet_type", values="total_fats", aggfunc="sum"
+    )
+    return matrix.reindex(index=rows, columns=fleet_names).fillna(0)
+
+
+def alliance_chart_specs(month, year):
+    try:
+        ally = EveonlineEveallianceinfo.objects.get(
+            alliance_id=settings.STATS_ALLIANCE_ID
+        )
+        all_corps = list(
+            EveonlineEvecorporationinfo.objects.filter(alliance=ally)
+            .exclude(corporation_id__in=settings.STATS_IGNORE_CORPS)
+            .order_by("corporation_ticker")
+            .values_list("corporation_id", "corporation_ticker")
+        )
+    except EveonlineEveallianceinfo.DoesNotExist:
+        all_corps = []
+    corp_ids = [corp_id for corp_id, _ in all_corps]
+    corp_names = [ticker for _, ticker in all_corps]
+    corp_tickers = dict(all_corps)
+
+    # Number of mains per corp for the relative participation, as of the month
+    main_counts = dict(
+        MonthlyCorpMembership.objects.filter(
+            period=month_period(month, year), corporation_id__in=corp_ids
+        ).values_list("corporation_id", "main_count")
+    )
+
+    fleet_names = defaultdict(list)
+    for name, source in MonthlyFleetType.objects.filter(
+        period=month_period(month, year)
+    ).values_list("name", "source"):
+        fleet_names[source].append(name)
+
+    stats = pd.DataFrame(
+        [
+            (corp_tickers[corp_id], source, fleet_type, total_fats)
+            for corp_id, source, fleet_type, total_fats in MonthlyCorpStats.objects.filter(
+                period=month_period(month, year), corporation_id__in=corp_ids
+            ).values_list(
+                "corporation_id", "fleet_type__source", "fleet_type__name", "total_fats"
+            )
+        ],
+        columns=["row", "source", "fleet_type", "total_fats"],
+    )
+
+    df_afat = _source_matrix(stats, "afat", corp_names, fleet_names["afat"])
+    df_imp = _source_matrix(stats, "imp", corp_names, fleet_names["imp"])
+
+    # Relative participation chart
+    mains = pd.Series(
+        [main_counts.get(corp_id, 0) for corp_id in corp_ids], index=corp_names
+    )
+    df_relative = (
+        pd.DataFrame({"AFAT": df_afat.sum(axis=1), "IMP": df_imp.sum(axis=1)})
+        .div(mains.where(mains > 0), axis=0)
+        .fillna(0)
+    )
+
+    # Filter out columns with zero sums
+    df_afat = df_afat.loc[:, (df_afat.sum(axis=0) != 0)]
+    df_imp = df_imp.loc[:, (df_imp.sum(axis=0) != 0)]
+
+    title_month = f"{calendar.month_name[month]} {year}"
+    specs = [
+        (
+            "afat_chart",
+            renderers.alliance_breakdown_chart,
+            {
+                "corp_names": corp_names,
+                "columns": {column: df_afat[column].tolist() for column in df_afat},
+                "colormap": "viridis",
+                "title": f"LAWN Fleet Breakdown for {title_month}",
+                "ylabel": "Total Fats",
+            },
+        ),
+        (
+            "imp_chart",
+            renderers.alliance_breakdown_chart,
+            {
+                "corp_names": corp_names,
+                "columns": {column: df_imp[column].tolist() for column in df_imp},
+                "colormap": "winter",
+                "title": f"IMPERIUM Fleet Breakdown for {title_month}",
+                "ylabel": "Total Paps",
+            },
+        ),
+        (
+            "combined_chart",
+            renderers.alliance_combined_chart,
+            {
+                "corp_names": corp_names,
+                "total_afat": df_afat.sum(axis=1).tolist(),
+                "total_imp": df_imp.sum(axis=1).tolist(),
+                "title": f"Fleet Participation for {title_month}",
+            },
+        ),
+    ]
+
+    # Matplotlib can't draw a pie without any wedges
+    afat_totals = df_afat.sum(axis=0)
+    if afat_totals.sum() > 0:
+        specs.append(
+            (
+                "pie_chart",
+                renderers.alliance_pie_chart,
+                {
+                    "labels": list(afat_totals.index),
+                    "totals": afat_totals.tolist(),
+                    "title": f"Fleet Type Participation for {title_month}",
+                },
+            )
+        )
+
+    # Line chart for month over month AFAT data
+    date_range = _trend_months(month, year)
+    afat_stats = (
+        MonthlyCorpTotals.objects.filter(
+            period__range=_period_range(date_range),
+            corporation_id__in=corp_ids,
+            source="afat",
+        )
+        .values("period")
+        .annotate(total=Sum("total_fats"))
+        .order_by("period")
+    )
+
+    date_totals = {date: 0 for date in date_range}
+    for item in afat_stats:
+        date_totals[divmod(item["period"], 100)] = item["total"]
+
+    specs.append(
+        (
+            "line_chart",
+            renderers.alliance_line_chart,
+            {
+                "date_range": list(date_totals),
+                "totals": list(date_totals.values()),
+                "running_avg": _running_average(date_totals.values()),
+                "title": "Month Over Month Lawn Fats",
+            },
+        )
+    )
+    if main_counts or not corp_ids:
+        specs.append(
+            (
+                "relative_chart",
+                renderers.alliance_relative_chart,
+                {
+                    "corp_names": corp_names,
+                    "afat": df_relative["AFAT"].tolist(),
+                    "imp": df_relative["IMP"].tolist(),
+                    "title": f"Relative Participation(Fleets/Main) for {title_month}",
+                },
+            )
+        )
+    else:
+        logger.warning(
+            f"No corp membership snapshot for {month}/{year}, leaving out the "
+            "relative participation chart. Run rebuild_corp_totals to take one."
+        )
+
+    return specs
+
+
+def alliance_charts(month, year):
+    # Missing charts are shown as empty
+    return {
+        "pie_chart": b"",
+        "relative_chart": b"",
+        **_render(alliance_chart_specs(month, year)),
+    }
+
+
+def corp_chart_specs(month, year):
+    ally = EveonlineEveallianceinfo.objects.get(alliance_id=settings.STATS_ALLIANCE_ID)
+    all_corps = (
+        EveonlineEvecorporationinfo.objects.filter(alliance=ally)
+        .exclude(corporation_id__in=settings.STATS_IGNORE_CORPS)
+        .order_by("corporation_name")
+    )
+
+    # Mains of all corps in one query, the stats of their users in another
+    corp_members = defaultdict(list)
+    user_mains = {}
+    for user_id, character_name, corporation_id in (
+        AuthenticationUserprofile.objects.filter(
+            main_character__corporation_id__in=[
+                corp.corporation_id for corp in all_corps
+            ]
+        )
+        .order_by("main_character__character_name")
+        .values_list(
+            "user_id",
+            "main_character__character_name",
+            "main_character__corporation_id",
+        )
+    ):
+        corp_members[corporation_id].append(character_name)
+        user_mains[user_id] = (corporation_id, character_name)
+
+    fleet_names = defaultdict(list)
+    for name, source in MonthlyFleetType.objects.filter(
+        period=month_period(month, year)
+    ).values_list("name", "source"):
+        fleet_names[source].append(name if source == "afat" else f"IMP {name}")
+
+    month_stats = pd.DataFrame(
+        [
+            (
+                *user_mains[user_id],
+                source,
+                name if source == "afat" else f"IMP {name}",
+                total_fats,
+            )
+            for user_id, source, name, total_fats in MonthlyUserStats.objects.filter(
+                user_id__in=list(user_mains), period=month_period(month, year)
+            ).values_list(
+                "user_id", "fleet_type__source", "fleet_type__name", "total_fats"
+            )
+        ],
+        columns=["corporation_id", "row", "source", "fleet_type", "total_fats"],
+    )
+    corp_stats = dict(tuple(month_stats.groupby("corporation_id")))
+
+    # Month over month totals of all corps
+    date_range = _trend_months(month, year)
+    trend_totals = defaultdict(int)
+    for corporation_id, source, period, total_fats in MonthlyCorpTotals.objects.filter(
+        period__range=_period_range(date_range),
+        corporation_id__in=[corp.corporation_id for corp in all_corps],
+    ).values_list("corporation_id", "source", "period", "total_fats"):
+        trend_totals[(corporation_id, source, *divmod(period, 100))] = total_fats
+
+    title_month = f"{calendar.month_name[month]} {year}"
+    specs = []
+
+    for corp in all_corps:
+        users = corp_members[corp.corporation_id]
+        stats = corp_stats.get(corp.corporation_id, month_stats.iloc[0:0])
+
+        df_afat = _source_matrix(stats, "afat", users, fleet_names["afat"])
+        df_imp = _source_matrix(stats, "imp", users, fleet_names["imp"])
+
+        df_afat = df_afat.loc[:, (df_afat != 0).any(axis=0)]
+        df_imp = df_imp.loc[:, (df_imp != 0).any(axis=0)]
+
+        title = f"{corp.corporation_name} Fleet Breakdown for {title_month}"
+        if not df_afat.empty or not df_imp.empty:
+            specs.append(
+                (
+                    corp.corporation_name,
+                    renderers.corp_breakdown_chart,
+                    {
+                        "users": users,
+                        "afat_columns": {
+                            column: df_afat[column].tolist() for column in df_afat
+                        },
+                        "imp_columns": {
+                            column: df_imp[column].tolist() for column in df_imp
+                        },
+                        "title": title,
+                    },
+                )
+            )
+        else:
+            specs.append(
+                (
+                    corp.corporation_name,
+                    renderers.corp_placeholder_chart,
+                    {"title": title},
+                )
+            )
+
+        # Line chart for month over month AFAT and IMP data for each corp
+        totals_afat = [
+            trend_totals[(corp.corporation_id, "afat", *date)] for date in date_range
+        ]
+        totals_imp = [
+            trend_totals[(corp.corporation_id, "imp", *date)] for date in date_range
+        ]
+        specs.append(
+            (
+                f"{corp.corporation_name}_line",
+                renderers.corp_line_chart,
+                {
+                    "date_range": date_range,
+                    "totals_afat": totals_afat,
+                    "running_avg_afat": _running_average(totals_afat),
+                    "totals_imp": totals_imp,
+                    "running_avg_imp": _running_average(totals_imp),
+                    "title": f"{corp.corporation_name} Month Over Month",
+                },
+            )
+        )
+
+    return specs
+
+
+def corp_charts(month, year):
+    return _render(corp_chart_specs(month, year))
+
+
+def raw_data_view(month, year):
+    raw_data = {}
+    top_afat_users = []
+    top_combined_users = []
+
+    try:
+        ally = EveonlineEveallianceinfo.objects.get(
+            alliance_id=settings.STATS_ALLIANCE_ID
+        )
+    except EveonlineEveallianceinfo.DoesNotExist:
+        return raw_data
+
+    all_corps = (
+        EveonlineEvecorporationinfo.objects.filter(alliance=ally)
+        .exclude(corporation_id__in=settings.STATS_IGNORE_CORPS)
+        .order_by("corporation_name")
+    )
+
+    # All mains of the alliance in one query, totals per user in another
+    members = (
+        AuthenticationUserprofile.objects.filter(
+            main_character__corporation_id__in=[
+                corp.corporation_id for corp in all_corps
+            ]
+        )
+        .order_by("main_character__character_name")
+        .values(
+            "user_id",
+            "main_character__character_name",
+            "main_character__corporation_id",
+        )
+    )
+    corp_members = defaultdict(list)
+    for member in members:
+        corp_members[member["main_character__corporation_id"]].append(member)
+
+    user_totals = {
+        row["user_id"]: row
+        for row in MonthlyUserStats.objects.filter(
+            user_id__in=[member["user_id"] for member in members],
+            period=month_period(month, year),
+        )
+        .values("user_id")
+        .annotate(
+            afat_total=Sum("total_fats", filter=Q(fleet_type__source="afat")),
+            imp_total=Sum("total_fats", filter=Q(fleet_type__source="imp")),
+        )
+    }
+
+    user_data = []
+
+    for corp in all_corps:
+        main_to_data = defaultdict(lambda: {"afat_total": 0, "imp_total": 0})
+
+        for member in corp_members[corp.corporation_id]:
+            main_character = member["main_character__character_name"]
+            totals = user_totals.get(member["user_id"], {})
+            afat_total = totals.get("afat_total") or 0
+            imp_total = totals.get("imp_total") or 0
+
+            main_to_data[main_character]["afat_total"] += afat_total
+            main_to_data[main_character]["imp_total"] += imp_total
+
+            # Collect user data for top 5 calculations
+            user_data.append(
+                {
+                    "name": main_character,
+                    "afat_total": afat_total,
+                    "combined_total": afat_total + imp_total,
+                }
+            )
+
+        corp_data = sorted(
+            [
+                {
+                    "name": main,
+                    "afat_total": data["afat_total"],
+                    "imp_total": data["imp_total"],
+                }
+                for main, data in main_to_data.items()
+            ],
+            key=lambda x: x["name"],
+        )
+
+        raw_data[corp.corporation_name] = corp_data
+
+    # Sort the user data and get top 5
+    top_afat_users = sorted(user_data, key=lambda x: x["afat_total"], reverse=True)[:5]
+    top_combined_users = sorted(
+        user_data, key=lambda x: x["combined_total"], reverse=True
+    )[:5]
+
+    return {
+        "raw_data": raw_data,
+        "top_afat_users": top_afat_users,
+        "top_combined_users": top_combined_users,
+    }
+
+
+# Charts of a month also show the months before it, so their cache
+# version covers the whole trend window
+TREND_MONTHS = months_to_display + 1
+
+
+# name: (render function, number of months the section looks at)
+CHART_SECTIONS = {
+    "creator_charts": (creator_charts, TREND_MONTHS),
+    "alliance_charts": (alliance_charts, TREND_MONTHS),
+    "corp_charts": (corp_charts, TREND_MONTHS),
+    "raw_data": (raw_data_view, 1),
+}
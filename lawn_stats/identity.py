@@ -0,0 +1,284 @@
+"""Cached resolution of characters and CSV account names to users and mains"""
+
+import hashlib
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .app_settings import (
+    LAWN_STATS_AFAT_CHUNK_SIZE,
+    LAWN_STATS_IDENTITY_CACHE_TIMEOUT,
+    LAWN_STATS_IDENTITY_LRU_SIZE,
+)
+from .models import (
+    AuthenticationCharacterownership,
+    AuthenticationUserprofile,
+    EveonlineEvecharacter,
+    EveonlineEvecorporationinfo,
+    UnknownAccount,
+)
+
+logger = get_extension_logger(__name__)
+
+# The user a character or account belongs to and the corporation its stats
+# are stored against. corporation_known is False when the corporation has no
+# EveonlineEvecorporationinfo or the user has no main.
+Identity = namedtuple(
+    "Identity", ["user_id", "corporation_id", "alliance_id", "corporation_known"]
+)
+
+_VERSION_KEY = "lawn_stats:identity:version"
+
+# In-process LRU tier in front of the Django cache, key: ("character", id),
+# ("account", name) or ("user", id), value: (expires, cached value)
+_local = OrderedDict()
+_local_version = None
+_lock = Lock()
+
+
+def _version():
+    return cache.get_or_set(_VERSION_KEY, time.time_ns, None)
+
+
+def _cache_key(version, key):
+    kind, value = key
+    # Account names may contain characters that aren't valid in cache keys
+    if kind == "account":
+        value = hashlib.md5(value.encode()).hexdigest()
+    return f"lawn_stats:identity:{version}:{kind}:{value}"
+
+
+def invalidate():
+    """Forget all cached identities, in this and every other process"""
+    cache.set(_VERSION_KEY, time.time_ns(), None)
+    with _lock:
+        _local.clear()
+
+
+def _cached(kind, values, version, load):
+    """
+    Look values up in the in-process LRU, then the Django cache and load
+    the remaining misses from the databases
+
+    Entries keep the expiry time they were loaded with in both tiers, so
+    the LRU doesn't hold them longer than LAWN_STATS_IDENTITY_CACHE_TIMEOUT.
+
+    :param load: function returning {value: cached value} for a set of values
+    :return: {value: cached value}
+    """
+    global _local_version
+
+    now = time.time()
+    found = {}
+    with _lock:
+        if version != _local_version:
+            _local.clear()
+            _local_version = version
+        for value in values:
+            entry = _local.get((kind, value))
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del _local[(kind, value)]
+            else:
+                _local.move_to_end((kind, value))
+                found[value] = entry[1]
+
+    entries = {}
+    missing = set(values) - set(found)
+    if missing:
+        cache_keys = {_cache_key(version, (kind, value)): value for value in missing}
+        for cache_key, entry in cache.get_many(list(cache_keys)).items():
+            if entry[0] > now:
+                entries[cache_keys[cache_key]] = entry
+        missing -= set(entries)
+
+    if missing:
+        expires = now + LAWN_STATS_IDENTITY_CACHE_TIMEOUT
+        loaded = {value: (expires, cached) for value, cached in load(missing).items()}
+        cache.set_many(
+            {
+                _cache_key(version, (kind, value)): entry
+                for value, entry in loaded.items()
+            },
+            LAWN_STATS_IDENTITY_CACHE_TIMEOUT,
+        )
+        entries.update(loaded)
+        logger.debug(
+            f"Resolved {len(loaded)} of {len(values)} {kind} identities "
+            "from the database"
+        )
+
+    with _lock:
+        for value, entry in entries.items():
+            _local[(kind, value)] = entry
+            _local.move_to_end((kind, value))
+        while len(_local) > LAWN_STATS_IDENTITY_LRU_SIZE:
+            _local.popitem(last=False)
+
+    found.update((value, entry[1]) for value, entry in entries.items())
+    return found
+
+
+def _corporation_known(corporation_id_field):
+    return Exists(
+        EveonlineEvecorporationinfo.objects.filter(
+            corporation_id=OuterRef(corporation_id_field)
+        )
+    )
+
+
+def _load_mains(user_ids):
+    """Return the Identity of the main of the users as tuples"""
+    mains = {user_id: (user_id, None, None, False) for user_id in user_ids}
+    for user_id, corporation_id, alliance_id, corporation_known in (
+        AuthenticationUserprofile.objects.filter(
+            user_id__in=set(user_ids), main_character__isnull=False
+        )
+        .annotate(
+            corporation_known=_corporation_known("main_character__corporation_id")
+        )
+        .values_list(
+            "user_id",
+            "main_character__corporation_id",
+            "main_character__alliance_id",
+            "corporation_known",
+        )
+        .iterator(chunk_size=LAWN_STATS_AFAT_CHUNK_SIZE)
+    ):
+        mains[user_id] = (user_id, corporation_id, alliance_id, corporation_known)
+    return mains
+
+
+def _load_characters(character_ids):
+    """Characters resolve to (owner,), characters without an owner to ()"""
+    character_users = dict(
+        AuthenticationCharacterownership.objects.filter(
+            character_id__in=set(character_ids)
+        )
+        .values_list("character_id", "user_id")
+        .iterator(chunk_size=LAWN_STATS_AFAT_CHUNK_SIZE)
+    )
+    return {
+        character_id: (
+            (character_users[character_id],) if character_id in character_users else ()
+        )
+        for character_id in character_ids
+    }
+
+
+def _load_accounts(account_names):
+    """
+    Known characters resolve to their owner and their own corporation as an
+    Identity tuple, anything else goes through UnknownAccount to (user,),
+    which resolves to the user's main. Accounts without a mapped user
+    resolve to ().
+    """
+    characters = {}
+    for character_id, character_name, corporation_id, alliance_id, known in (
+        EveonlineEvecharacter.objects.filter(character_name__in=account_names)
+        .annotate(corporation_known=_corporation_known("corporation_id"))
+        .order_by("id")
+        .values_list(
+            "id",
+            "character_name",
+            "corporation_id",
+            "alliance_id",
+            "corporation_known",
+        )
+    ):
+        characters.setdefault(
+            character_name, (character_id, corporation_id, alliance_id, known)
+        )
+
+    character_users = dict(
+        AuthenticationCharacterownership.objects.filter(
+            character_id__in=[character[0] for character in characters.values()]
+        ).values_list("character_id", "user_id")
+    )
+
+    resolved = {}
+    for account_name, character in characters.items():
+        character_id, corporation_id, alliance_id, known = character
+        if character_id in character_users and known:
+            resolved[account_name] = (
+                character_users[character_id],
+                corporation_id,
+                alliance_id,
+                True,
+            )
+
+    # Handle unknown accounts
+    unknown_names = set(account_names) - set(resolved)
+    unknown_users = dict(
+        UnknownAccount.objects.filter(account_name__in=unknown_names).values_list(
+            "account_name", "user_id"
+        )
+    )
+    UnknownAccount.objects.bulk_create(
+        [
+            UnknownAccount(account_name=account_name)
+            for account_name in unknown_names - set(unknown_users)
+        ],
+        ignore_conflicts=True,
+    )
+
+    for account_name in unknown_names:
+        user_id = unknown_users.get(account_name)
+        resolved[account_name] = (user_id,) if user_id else ()
+    return resolved
+
+
+def resolve_many(names_or_ids):
+    """
+    Resolve character ids and CSV account names to their Identity
+
+    Characters and accounts are resolved to their user first, then every
+    user once to their main, so all characters of a user get the same main
+    corporation. Each step goes through an in-process LRU, then the Django
+    cache and only for the remaining misses to the databases, with one
+    query per hop. Cached entries expire after
+    LAWN_STATS_IDENTITY_CACHE_TIMEOUT and are dropped when an
+    UnknownAccount mapping changes.
+
+    :param names_or_ids: character ids (int) and account names (str)
+    :return: {name_or_id: Identity or None if it can't be resolved}
+    """
+    version = _version()
+    names_or_ids = set(names_or_ids)
+
+    owners = _cached(
+        "character",
+        {value for value in names_or_ids if not isinstance(value, str)},
+        version,
+        _load_characters,
+    )
+    owners.update(
+        _cached(
+            "account",
+            {value for value in names_or_ids if isinstance(value, str)},
+            version,
+            _load_accounts,
+        )
+    )
+    mains = _cached(
+        "user",
+        {owner[0] for owner in owners.values() if len(owner) == 1},
+        version,
+        _load_mains,
+    )
+
+    resolved = {}
+    for name_or_id, owner in owners.items():
+        if not owner:
+            resolved[name_or_id] = None
+        elif len(owner) == 1:
+            resolved[name_or_id] = Identity(*mains[owner[0]])
+        else:
+            resolved[name_or_id] = Identity(*owner)
+    return resolved
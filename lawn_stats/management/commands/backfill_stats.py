@@ -0,0 +1,184 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from celery.backends.base import DisabledBackend
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from lawn_stats.tasks import backfill_month
+
+
+def _month(value):
+    try:
+        date = datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a YYYY-MM month")
+    return date.year, date.month
+
+
+def _months(start, end):
+    """Return (month, year) of every month from start to end, both (year, month)"""
+    year, month = start
+    while (year, month) <= end:
+        yield month, year
+        month += 1
+        if month == 13:
+            month = 1
+            year += 1
+
+
+def _init_worker():
+    # Every process needs its own database connections
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stats of a range of months in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="start",
+            type=_month,
+            required=True,
+            help="First month to rebuild, YYYY-MM",
+        )
+        parser.add_argument(
+            "--to",
+            dest="end",
+            type=_month,
+            help="Last month to rebuild, YYYY-MM, the current month if not given",
+        )
+        parser.add_argument(
+            "--source",
+            choices=["afat", "imp"],
+            default="afat",
+            help=(
+                "afat processes the months again from the AFAT data, "
+                "imp rebuilds the tables derived from the uploaded IMP stats"
+            ),
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Remove the AFAT stats of the months first, else months with stats are skipped",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Months processed at the same time",
+        )
+        parser.add_argument(
+            "--local",
+            action="store_true",
+            help="Process the months in a local process pool instead of celery",
+        )
+
+    def handle(self, *args, **options):
+        now = datetime.now()
+        start = options["start"]
+        end = options["end"] or (now.year, now.month)
+        if start > end:
+            raise CommandError("--from must not be after --to")
+        if not options["local"] and isinstance(backfill_month.backend, DisabledBackend):
+            raise CommandError(
+                "Following the celery tasks needs a celery result backend, "
+                "configure one or run the months with --local"
+            )
+
+        months = list(_months(start, end))
+        concurrency = max(1, options["concurrency"])
+        run_args = (options["source"], options["clear"])
+
+        self.stdout.write(
+            f"Rebuilding {options['source']} stats of {len(months)} months, "
+            f"{concurrency} at a time"
+        )
+        started = time.perf_counter()
+        if options["local"]:
+            failed, skipped = self._run_local(months, concurrency, run_args)
+        else:
+            failed, skipped = self._run_celery(months, concurrency, run_args)
+
+        self.stdout.write(
+            f"Rebuilt {len(months) - len(failed) - len(skipped)} of {len(months)} "
+            f"months in {time.perf_counter() - started:.1f}s"
+        )
+        if skipped:
+            self.stdout.write(
+                f"Skipped {len(skipped)} months that already have stats, "
+                "use --clear to rebuild them: "
+                + ", ".join(f"{year}-{month:02d}" for month, year in skipped)
+            )
+        if failed:
+            raise CommandError(
+                "Failed months: "
+                + ", ".join(f"{year}-{month:02d}" for month, year in failed)
+            )
+        self.stdout.write(self.style.SUCCESS("Successfully rebuilt stats"))
+
+    def _report(self, done, total, month, year, seconds=None, error=None):
+        if error is not None:
+            self.stderr.write(f"[{done}/{total}] {year}-{month:02d} failed: {error}")
+        elif seconds is None:
+            self.stdout.write(f"[{done}/{total}] {year}-{month:02d} skipped")
+        else:
+            self.stdout.write(f"[{done}/{total}] {year}-{month:02d} {seconds:.1f}s")
+
+    def _run_local(self, months, concurrency, run_args):
+        failed = []
+        skipped = []
+        # Forked processes must not share the connections of this one
+        connections.close_all()
+        with ProcessPoolExecutor(concurrency, initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(backfill_month, month, year, *run_args): (month, year)
+                for month, year in months
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                month, year = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as exc:
+                    failed.append((month, year))
+                    self._report(done, len(months), month, year, error=exc)
+                    continue
+                if seconds is None:
+                    skipped.append((month, year))
+                self._report(done, len(months), month, year, seconds)
+        return failed, skipped
+
+    def _run_celery(self, months, concurrency, run_args):
+        """Keep concurrency months queued, needs a celery result backend"""
+        failed = []
+        skipped = []
+        queued = list(months)
+        running = {}
+        done = 0
+        while queued or running:
+            while queued and len(running) < concurrency:
+                month, year = queued.pop(0)
+                running[(month, year)] = backfill_month.delay(month, year, *run_args)
+
+            for (month, year), result in list(running.items()):
+                if not result.ready():
+                    continue
+                del running[(month, year)]
+                done += 1
+                if result.successful():
+                    if result.result is None:
+                        skipped.append((month, year))
+                    self._report(done, len(months), month, year, result.result)
+                else:
+                    failed.append((month, year))
+                    self._report(done, len(months), month, year, error=result.result)
+
+            if running:
+                time.sleep(1)
+        return failed, skipped
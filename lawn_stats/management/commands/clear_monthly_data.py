@@ -1,10 +1,14 @@
 from django.core.management.base import BaseCommand
 
+from lawn_stats.chart_cache import bump_data_version
 from lawn_stats.models import (
+    MonthlyAfatWatermark,
     MonthlyCorpStats,
+    MonthlyCorpTotals,
     MonthlyCreatorStats,
     MonthlyFleetType,
     MonthlyUserStats,
+    month_period,
 )
 
 
@@ -27,6 +31,9 @@ class Command(BaseCommand):
         MonthlyUserStats.objects.filter(month=month, year=year).delete()
         MonthlyCreatorStats.objects.filter(month=month, year=year).delete()
         MonthlyFleetType.objects.filter(month=month, year=year).delete()
+        MonthlyAfatWatermark.objects.filter(month=month, year=year).delete()
+        MonthlyCorpTotals.objects.filter(period=month_period(month, year)).delete()
+        bump_data_version(month, year)
 
         self.stdout.write(
             self.style.SUCCESS(f"Successfully cleared data for {month}-{year}")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from lawn_stats.chart_cache import bump_data_version
+from lawn_stats.models import MonthlyCorpStats
+from lawn_stats.tasks import rebuild_corp_totals, snapshot_corp_membership
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly corp totals from the corp stats"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--month", type=int, help="Month to rebuild, all months if not given"
+        )
+        parser.add_argument(
+            "--year", type=int, help="Year to rebuild, all months if not given"
+        )
+
+    def handle(self, *args, **options):
+        month = options["month"]
+        year = options["year"]
+
+        if month and year:
+            months = [(month, year)]
+        else:
+            months = (
+                MonthlyCorpStats.objects.values_list("month", "year")
+                .distinct()
+                .order_by("year", "month")
+            )
+
+        for month, year in months:
+            # Months without a membership snapshot get one of today's members
+            snapshot_corp_membership(month, year)
+            rebuild_corp_totals(month, year)
+            bump_data_version(month, year)
+            self.stdout.write(f"Rebuilt corp totals for {month}-{year}")
+
+        self.stdout.write(self.style.SUCCESS("Successfully rebuilt corp totals"))
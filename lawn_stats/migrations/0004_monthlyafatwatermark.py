@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lawn_stats", "0003_fleettypelimit"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyAfatWatermark",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.IntegerField()),
+                ("year", models.IntegerField()),
+                ("last_fat_id", models.PositiveIntegerField(default=0)),
+                ("last_fatlink_created", models.DateTimeField(blank=True, null=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("month", "year")},
+            },
+        ),
+    ]
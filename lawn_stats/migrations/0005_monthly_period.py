@@ -0,0 +1,82 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:16
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_period(apps, schema_editor):
+    for model_name in (
+        "MonthlyFleetType",
+        "MonthlyCorpStats",
+        "MonthlyUserStats",
+        "MonthlyCreatorStats",
+    ):
+        model = apps.get_model("lawn_stats", model_name)
+        model.objects.update(period=F("year") * 100 + F("month"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lawn_stats", "0004_monthlyafatwatermark"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="monthlycorpstats",
+            name="period",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="monthlycreatorstats",
+            name="period",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="monthlyfleettype",
+            name="period",
+            field=models.IntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="monthlyuserstats",
+            name="period",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_period, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="monthlycorpstats",
+            index=models.Index(
+                fields=["period", "fleet_type"], name="lawn_stats__period_b08216_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="monthlycorpstats",
+            index=models.Index(
+                fields=["corporation_id", "period"],
+                name="lawn_stats__corpora_f22f6d_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="monthlycreatorstats",
+            index=models.Index(
+                fields=["period", "fleet_type"], name="lawn_stats__period_6cd681_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="monthlycreatorstats",
+            index=models.Index(
+                fields=["creator_id", "period"], name="lawn_stats__creator_a9a8dc_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="monthlyuserstats",
+            index=models.Index(
+                fields=["period", "fleet_type"], name="lawn_stats__period_c86087_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="monthlyuserstats",
+            index=models.Index(
+                fields=["user_id", "period"], name="lawn_stats__user_id_f4ff64_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lawn_stats", "0005_monthly_period"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyCorpTotals",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("corporation_id", models.PositiveIntegerField()),
+                ("period", models.IntegerField()),
+                ("source", models.CharField(max_length=10)),
+                ("total_fats", models.PositiveIntegerField(default=0)),
+                ("main_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["period", "source"],
+                        name="lawn_stats__period_8668a5_idx",
+                    )
+                ],
+                "unique_together": {("corporation_id", "period", "source")},
+            },
+        ),
+    ]
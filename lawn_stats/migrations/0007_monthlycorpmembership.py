@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lawn_stats", "0006_monthlycorptotals"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyCorpMembership",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("corporation_id", models.PositiveIntegerField()),
+                ("period", models.IntegerField(db_index=True)),
+                ("main_count", models.PositiveIntegerField(default=0)),
+                ("taken", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("corporation_id", "period")},
+            },
+        ),
+    ]
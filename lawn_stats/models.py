@@ -35,25 +35,48 @@ class General(models.Model):
         permissions = (("basic_access", "Can access this app"),)
 
 
-class MonthlyFleetType(models.Model):
+def month_period(month, year):
+    """Return the yyyymm period key of a month"""
+    return year * 100 + month
+
+
+class MonthlyPeriodMixin:
+    """
+    Keeps the yyyymm period of monthly rows in sync with month and year
+
+    Bulk writes don't call save(), they have to set period themselves.
+    """
+
+    def save(self, *args, **kwargs):
+        self.period = month_period(self.month, self.year)
+        super().save(*args, **kwargs)
+
+
+class MonthlyFleetType(MonthlyPeriodMixin, models.Model):
     name = models.CharField(max_length=100)
     source = models.CharField(max_length=10)  # 'Imp' or 'afat'
     month = models.IntegerField()
     year = models.IntegerField()
+    period = models.IntegerField(default=0, db_index=True, editable=False)
 
     class Meta:
         unique_together = ("name", "source", "month", "year")
 
 
-class MonthlyCorpStats(models.Model):
+class MonthlyCorpStats(MonthlyPeriodMixin, models.Model):
     corporation_id = models.PositiveIntegerField()
     month = models.IntegerField()
     year = models.IntegerField()
+    period = models.IntegerField(default=0, editable=False)
     fleet_type = models.ForeignKey(MonthlyFleetType, on_delete=models.CASCADE)
     total_fats = models.PositiveIntegerField()
 
     class Meta:
         unique_together = ("corporation_id", "month", "year", "fleet_type")
+        indexes = [
+            models.Index(fields=["period", "fleet_type"]),
+            models.Index(fields=["corporation_id", "period"]),
+        ]
 
     def get_corporation(self):
 
@@ -62,16 +85,21 @@ class MonthlyCorpStats(models.Model):
         )
 
 
-class MonthlyUserStats(models.Model):
+class MonthlyUserStats(MonthlyPeriodMixin, models.Model):
     user_id = models.PositiveIntegerField()
     corporation_id = models.PositiveIntegerField()
     month = models.IntegerField()
     year = models.IntegerField()
+    period = models.IntegerField(default=0, editable=False)
     fleet_type = models.ForeignKey(MonthlyFleetType, on_delete=models.CASCADE)
     total_fats = models.PositiveIntegerField()
 
     class Meta:
         unique_together = ("user_id", "month", "year", "fleet_type")
+        indexes = [
+            models.Index(fields=["period", "fleet_type"]),
+            models.Index(fields=["user_id", "period"]),
+        ]
 
     def get_user(self):
 
@@ -102,21 +130,74 @@ class IgnoredCSVColumns(models.Model):
         return self.column_name
 
 
-class MonthlyCreatorStats(models.Model):
+class MonthlyCreatorStats(MonthlyPeriodMixin, models.Model):
     creator_id = models.IntegerField()
     month = models.IntegerField()
     year = models.IntegerField()
+    period = models.IntegerField(default=0, editable=False)
     fleet_type = models.ForeignKey(MonthlyFleetType, on_delete=models.CASCADE)
     total_created = models.IntegerField(default=0)
 
     class Meta:
         unique_together = (("creator_id", "month", "year", "fleet_type"),)
+        indexes = [
+            models.Index(fields=["period", "fleet_type"]),
+            models.Index(fields=["creator_id", "period"]),
+        ]
 
     def get_creator(self):
 
         return AuthUser.objects.get(pk=self.creator_id)
 
 
+class MonthlyCorpTotals(models.Model):
+    """Totals of a corp per month and source, maintained by the ingestion tasks"""
+
+    corporation_id = models.PositiveIntegerField()
+    period = models.IntegerField()
+    source = models.CharField(max_length=10)
+    total_fats = models.PositiveIntegerField(default=0)
+    main_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("corporation_id", "period", "source")
+        indexes = [models.Index(fields=["period", "source"])]
+
+    def __str__(self):
+        return f"{self.corporation_id} {self.period} {self.source}: {self.total_fats}"
+
+
+class MonthlyCorpMembership(models.Model):
+    """Number of mains of a corp, taken when the month's stats are ingested"""
+
+    corporation_id = models.PositiveIntegerField()
+    period = models.IntegerField(db_index=True)
+    main_count = models.PositiveIntegerField(default=0)
+    taken = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("corporation_id", "period")
+
+    def __str__(self):
+        return f"{self.corporation_id} {self.period}: {self.main_count} mains"
+
+
+class MonthlyAfatWatermark(models.Model):
+    """High-water marks of the AFAT data already counted for a month"""
+
+    month = models.IntegerField()
+    year = models.IntegerField()
+    last_fat_id = models.PositiveIntegerField(default=0)
+    last_fatlink_created = models.DateTimeField(blank=True, null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("month", "year")
+
+    def __str__(self):
+        return f"{self.month}/{self.year}: fat {self.last_fat_id}, fatlink {self.last_fatlink_created}"
+
+
 class UnknownAccount(models.Model):
     account_name = models.CharField(max_length=255, unique=True)
     user_id = models.IntegerField(null=True, blank=True)
@@ -0,0 +1,455 @@
+"""
+Chart renderers
+
+Every renderer takes plain data and returns the chart as PNG bytes. They
+don't touch the database or Django, so they can run in worker processes.
+
+Figures are built directly on an Agg canvas instead of through pyplot, so
+rendering keeps no global state and is safe in threads.
+"""
+
+import calendar
+from datetime import datetime
+from io import BytesIO
+
+import matplotlib.dates as mdates
+import matplotlib.ticker as ticker
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps
+from matplotlib.artist import setp
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+CHART_BACKGROUND_COLOR = "#575555"
+
+VIRIDIS = colormaps["viridis"]
+COOL = colormaps["cool"]
+WINTER = colormaps["winter"]
+
+# Colormaps chart specs can refer to by name
+COLORMAPS = {"viridis": VIRIDIS, "cool": COOL, "winter": WINTER}
+
+# Keyword arguments shared by the charts of the dark theme
+TITLE_STYLE = {"color": "white", "fontsize": 16, "fontweight": "bold"}
+LEGEND_STYLE = {"facecolor": "#2c2f33", "edgecolor": "white", "labelcolor": "lightgray"}
+GRID_STYLE = {
+    "axis": "y",
+    "linestyle": "--",
+    "linewidth": 0.5,
+    "color": "grey",
+    "alpha": 0.7,
+}
+
+
+def _figure(figsize):
+    """Return a new figure on an Agg canvas with the dark background"""
+    fig = Figure(figsize=figsize, facecolor=CHART_BACKGROUND_COLOR)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _png(fig, **savefig_kwargs):
+    """Return the figure as PNG"""
+    buf = BytesIO()
+    fig.savefig(buf, format="png", **savefig_kwargs)
+    return buf.getvalue()
+
+
+def creator_bar_chart(index, columns, title):
+    """Stacked bar chart of the fleet types created per FC"""
+    df = pd.DataFrame(columns, index=index)
+    color_range = VIRIDIS(np.linspace(0, 1, len(df.columns)))
+
+    fig = _figure((12, 8))
+    ax = fig.subplots()
+    df.plot(ax=ax, kind="bar", stacked=True, color=color_range)
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+    ax.set_ylabel("Total Created", color="lightgray")
+    ax.set_title(title, **TITLE_STYLE)
+    setp(ax.get_xticklabels(), rotation=45, ha="right", color="white")
+    setp(ax.get_yticklabels(), color="white")
+    ax.legend(title_fontsize="13", fontsize="11", **LEGEND_STYLE)
+    ax.grid(**GRID_STYLE)
+    ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True, prune="both"))
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def creator_pie_chart(labels, values, title):
+    """Pie chart of the fleets created per fleet type"""
+    fig = _figure((8, 8))
+    ax = fig.subplots()
+    wedges, texts, autotexts = ax.pie(
+        values,
+        autopct="%1.1f%%",
+        startangle=140,
+        colors=VIRIDIS(np.linspace(0, 1, len(labels))),
+        pctdistance=0.85,
+    )
+    setp(texts, color="white")
+    setp(autotexts, color="black")
+    ax.legend(
+        wedges,
+        labels,
+        loc="center left",
+        bbox_to_anchor=(1, 0, 0.5, 1),
+        title_fontsize="13",
+        fontsize="11",
+        **LEGEND_STYLE,
+    )
+    ax.set_title(title, **TITLE_STYLE)
+    fig.tight_layout()
+
+    return _png(fig, bbox_inches="tight")
+
+
+def creator_line_chart(date_range, series, title):
+    """Line chart of the fleets created per fleet type and month"""
+    fig = _figure((12, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+    colors = VIRIDIS(np.linspace(0, 1, len(series)))
+
+    for (fleet_name, totals), color in zip(series.items(), colors):
+        ax.plot(
+            range(1, len(date_range) + 1),
+            totals,
+            marker="o",
+            label=fleet_name,
+            color=color,
+        )
+
+    ax.set_title(title, **TITLE_STYLE)
+    ax.set_ylabel("Total Fleets", color="white")
+    ax.set_xticks(range(1, len(date_range) + 1))
+    ax.set_xticklabels(
+        [f"{calendar.month_abbr[date[1]]} {date[0]}" for date in date_range],
+        color="white",
+        rotation=45,
+        ha="right",
+    )
+    setp(ax.get_yticklabels(), color="white")
+    ax.grid(**GRID_STYLE)
+    ax.legend(loc="upper left", **LEGEND_STYLE)
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def alliance_breakdown_chart(corp_names, columns, colormap, title, ylabel):
+    """Stacked bar chart of the fleet types per corp"""
+    df = pd.DataFrame(columns, index=corp_names)
+    x = np.arange(len(corp_names))
+
+    fig = _figure((12.8, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+    bottom = np.zeros(len(corp_names))
+    color_range = COLORMAPS[colormap](np.linspace(0, 1, len(df.columns)))
+
+    for idx, column in enumerate(df.columns):
+        ax.bar(x, df[column], bottom=bottom, color=color_range[idx], label=column)
+        bottom += df[column]
+
+    for i, total in enumerate(bottom):
+        ax.text(
+            i,
+            total,
+            f"{int(total)}",
+            ha="center",
+            va="bottom",
+            color="white",
+            fontsize=10,
+        )
+
+    ax.set_title(title, **TITLE_STYLE)
+    ax.set_ylabel(ylabel, color="lightgray")
+    ax.set_xticks(ticks=x)
+    ax.set_xticklabels(corp_names, rotation=45, ha="right", color="white")
+    ax.tick_params(axis="y", colors="lightgray")
+    ax.grid(**GRID_STYLE)
+    ax.legend(**LEGEND_STYLE)
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def alliance_combined_chart(corp_names, total_afat, total_imp, title):
+    """Bar chart of the AFAT and IMP totals per corp side by side"""
+    x = np.arange(len(corp_names))
+
+    fig = _figure((12.8, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+
+    ax.bar(x - 0.2, total_afat, width=0.4, label="LAWN", color="cyan")
+    ax.bar(x + 0.2, total_imp, width=0.4, label="IMP", color="blue")
+
+    for i in range(len(corp_names)):
+        ax.text(
+            i - 0.2,
+            total_afat[i],
+            f"{int(total_afat[i])}",
+            ha="center",
+            va="bottom",
+            color="white",
+        )
+        ax.text(
+            i + 0.2,
+            total_imp[i],
+            f"{int(total_imp[i])}",
+            ha="center",
+            va="bottom",
+            color="white",
+        )
+
+    ax.set_title(title, **TITLE_STYLE)
+    ax.set_ylabel("Total Fats", color="lightgray")
+    ax.set_xticks(ticks=x)
+    ax.set_xticklabels(corp_names, rotation=45, ha="right", color="white")
+    ax.tick_params(axis="y", colors="lightgray")
+    ax.grid(**GRID_STYLE)
+    ax.legend(**LEGEND_STYLE)
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def alliance_pie_chart(labels, totals, title):
+    """Pie chart of the AFAT fleet type proportions"""
+    fig = _figure((8, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+    wedges, texts, autotexts = ax.pie(
+        totals,
+        autopct=lambda p: f"{p:.1f}%" if p > 1 else "",
+        startangle=140,
+        colors=VIRIDIS(np.linspace(0, 1, len(labels))),
+        pctdistance=0.85,  # Adjust this value to move the labels further out
+    )
+    setp(texts, color="white")
+    setp(autotexts, color="black")
+    ax.set_title(title, **TITLE_STYLE)
+    ax.legend(
+        wedges,
+        labels,
+        loc="center left",
+        bbox_to_anchor=(1, 0, 0.5, 1),
+        title_fontsize="13",
+        fontsize="11",
+        **LEGEND_STYLE,
+    )
+    fig.tight_layout()
+
+    return _png(fig, bbox_inches="tight")
+
+
+def alliance_line_chart(date_range, totals, running_avg, title):
+    """Line chart of the AFAT totals per month with a running average"""
+    dates = [datetime(year=year, month=month, day=1) for year, month in date_range]
+
+    fig = _figure((12.8, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+    ax.plot(dates, totals, marker="o", color="cyan", label="Total Fats")
+    ax.plot(dates, running_avg, linestyle="--", color="orange", label="Running Average")
+
+    for i, total in enumerate(totals):
+        if total > 0:
+            ax.text(
+                dates[i],
+                total + 5,
+                f"{total}",
+                ha="center",
+                va="bottom",
+                color="white",
+                fontsize=10,
+            )
+
+    ax.set_title(title, **TITLE_STYLE)
+    ax.set_ylabel("Total Fats", color="lightgray")
+    ax.tick_params(axis="y", colors="lightgray")
+    ax.tick_params(axis="x", colors="lightgray", rotation=45)
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %Y"))
+    ax.grid(**GRID_STYLE)
+    ax.legend(**LEGEND_STYLE)
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def alliance_relative_chart(corp_names, afat, imp, title):
+    """Bar chart of the AFAT and IMP fleets per main of each corp"""
+    x = np.arange(len(corp_names))
+
+    fig = _figure((12.8, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+
+    bar_afat = ax.bar(x - 0.2, afat, width=0.4, label="LAWN", color="cyan")
+    bar_imp = ax.bar(x + 0.2, imp, width=0.4, label="IMP", color="blue")
+
+    for bar in [*bar_afat, *bar_imp]:
+        yval = bar.get_height()
+        if yval > 0:
+            ax.text(
+                bar.get_x() + bar.get_width() / 2,
+                yval,
+                f"{yval:.1f}",
+                ha="center",
+                va="bottom",
+                color="white",
+            )
+
+    ax.set_title(title, **TITLE_STYLE)
+    ax.set_ylabel("Relative Participation", color="lightgray")
+    ax.set_xticks(ticks=x)
+    ax.set_xticklabels(corp_names, rotation=45, ha="right", color="white")
+    ax.tick_params(axis="y", colors="lightgray")
+    ax.grid(**GRID_STYLE)
+    ax.legend(**LEGEND_STYLE)
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def corp_breakdown_chart(users, afat_columns, imp_columns, title):
+    """Bar chart of the AFAT and IMP fleet types per main of a corp"""
+    df_afat = pd.DataFrame(afat_columns, index=users)
+    df_imp = pd.DataFrame(imp_columns, index=users)
+
+    fig = _figure((12, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+
+    bar_width = 0.35
+    indices = np.arange(len(users))
+
+    bottom_afat = np.zeros(len(users))
+    bottom_imp = np.zeros(len(users))
+    colors_afat = VIRIDIS(np.linspace(0, 1, len(df_afat.columns)))
+    colors_imp = COOL(np.linspace(0, 1, len(df_imp.columns)))
+
+    for idx, column in enumerate(df_afat.columns):
+        ax.bar(
+            indices - bar_width / 2,
+            df_afat[column].values,
+            bar_width,
+            bottom=bottom_afat,
+            color=colors_afat[idx],
+            label=column,
+        )
+        bottom_afat += df_afat[column].values
+
+    for idx, column in enumerate(df_imp.columns):
+        ax.bar(
+            indices + bar_width / 2,
+            df_imp[column].values,
+            bar_width,
+            bottom=bottom_imp,
+            color=colors_imp[idx],
+            label=column,
+        )
+        bottom_imp += df_imp[column].values
+
+    ylim_bottom, ylim_top = ax.get_ylim()
+    if ylim_top < 5:
+        ax.set_ylim(0, 5)
+    else:
+        max_y = max(bottom_afat.max(), bottom_imp.max())
+        ax.set_ylim(0, max_y * 1.1)
+
+    for offset, bottom in ((-bar_width / 2, bottom_afat), (bar_width / 2, bottom_imp)):
+        for i, total in enumerate(bottom):
+            if total > 0:
+                ax.text(
+                    i + offset,
+                    total,
+                    f"{int(total)}",
+                    ha="center",
+                    va="bottom",
+                    color="white",
+                )
+
+    ax.set_title(title, **TITLE_STYLE)
+    ax.set_ylabel("Total Fats", color="white")
+    ax.set_xticks(indices)
+    ax.set_xticklabels(users, rotation=45, ha="right", color="white")
+    ax.grid(**GRID_STYLE)
+    ax.tick_params(axis="y", colors="lightgray")
+    ax.legend(**LEGEND_STYLE)
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def corp_placeholder_chart(title):
+    """Placeholder chart for corporations with no fats"""
+    fig = _figure((12, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+
+    ax.text(
+        0.5,
+        0.5,
+        "No Fats Data Available",
+        ha="center",
+        va="center",
+        color="white",
+        fontsize=16,
+    )
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_title(title, color="white")
+    fig.tight_layout()
+
+    return _png(fig)
+
+
+def corp_line_chart(
+    date_range, totals_afat, running_avg_afat, totals_imp, running_avg_imp, title
+):
+    """Line chart of the AFAT and IMP totals of a corp per month"""
+    dates = [datetime(year=year, month=month, day=1) for year, month in date_range]
+
+    fig = _figure((12, 8))
+    ax = fig.subplots()
+    ax.set_facecolor(CHART_BACKGROUND_COLOR)
+    ax.plot(dates, totals_afat, marker="o", color="cyan", label="Total Fats")
+    ax.plot(
+        dates, running_avg_afat, linestyle="--", color="orange", label="Running Avg"
+    )
+    ax.plot(dates, totals_imp, marker="o", color="blue", label="IMP Total Fats")
+    ax.plot(
+        dates, running_avg_imp, linestyle="--", color="purple", label="IMP Running Avg"
+    )
+
+    for totals in (totals_afat, totals_imp):
+        for i, total in enumerate(totals):
+            if total > 0:
+                ax.text(
+                    dates[i],
+                    total,
+                    f"{total}",
+                    ha="center",
+                    va="bottom",
+                    color="white",
+                    fontsize=10,
+                )
+
+    ax.set_ylim(0)  # Ensure y-axis starts at zero
+    ax.yaxis.get_major_locator().set_params(integer=True)  # Only integer ticks
+    ax.set_title(title, **TITLE_STYLE)
+    ax.set_ylabel("Total Fats", color="lightgray")
+    ax.tick_params(axis="y", colors="lightgray")
+    ax.tick_params(axis="x", colors="lightgray", rotation=45)
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %Y"))
+    ax.grid(**GRID_STYLE)
+    ax.legend(**LEGEND_STYLE)
+    fig.tight_layout()
+
+    return _png(fig)
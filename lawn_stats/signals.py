@@ -0,0 +1,14 @@
+"""Signal handlers"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import identity
+from .models import UnknownAccount
+
+
+@receiver(post_save, sender=UnknownAccount)
+@receiver(post_delete, sender=UnknownAccount)
+def unknown_account_changed(sender, instance, **kwargs):
+    """Account names resolved through the old mapping are no longer valid"""
+    identity.invalidate()
@@ -1,81 +1,106 @@
 # tasks.py
 
 import csv
-from datetime import datetime
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-from celery import shared_task
+from celery import chord, shared_task
+from celery.backends.base import DisabledBackend
 
 from django.conf import settings
-from django.db import IntegrityError, transaction
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
 
 from allianceauth.services.hooks import get_extension_logger
 
+from . import chart_cache, identity
+from .app_settings import (
+    LAWN_STATS_AFAT_CHUNK_SIZE,
+    LAWN_STATS_AFAT_SHARDS,
+    LAWN_STATS_CSV_UPLOAD_MAX_AGE,
+    LAWN_STATS_PREVIOUS_MONTH_UPDATE_DAYS,
+)
+from .charts import CHART_SECTIONS
 from .models import (
     AfatFat,
     AfatFatlink,
     AfatFleettype,
-    AuthenticationCharacterownership,
     AuthenticationUserprofile,
-    AuthUser,
-    EveonlineEvecharacter,
     EveonlineEvecorporationinfo,
+    MonthlyAfatWatermark,
+    MonthlyCorpMembership,
     MonthlyCorpStats,
+    MonthlyCorpTotals,
     MonthlyCreatorStats,
     MonthlyFleetType,
     MonthlyUserStats,
-    UnknownAccount,
+    month_period,
 )
+from .uploads import delete_csv_upload, delete_old_csv_uploads, open_csv_upload
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 logger = get_extension_logger(__name__)
 
 
-@shared_task
-def process_csv_task(csv_data, column_mapping, month, year):
-    user_stats_exists = MonthlyUserStats.objects.filter(
-        month=month, year=year, fleet_type__source="imp"
-    ).exists()
-    corp_stats_exists = MonthlyCorpStats.objects.filter(
-        month=month, year=year, fleet_type__source="imp"
-    ).exists()
+def _month_range(month, year):
+    """Return the [start, end) datetimes covering the given month"""
+    start_date = datetime(year, month, 1)
+    end_date = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+    return start_date, end_date
+
+
+def _ensure_fleet_types(names, source, month, year):
+    """
+    Create the missing MonthlyFleetTypes for the given names and return all
+    fleet types of the source for the month keyed by name
+
+    Missing fleet types are created in the order given, the charts list
+    fleet types in creation order.
+    """
+    fleet_types = MonthlyFleetType.objects.filter(source=source, month=month, year=year)
+    existing = {fleet_type.name for fleet_type in fleet_types}
+    MonthlyFleetType.objects.bulk_create(
+        [
+            MonthlyFleetType(
+                name=name,
+                source=source,
+                month=month,
+                year=year,
+                period=month_period(month, year),
+            )
+            for name in dict.fromkeys(names)
+            if name not in existing
+        ],
+        ignore_conflicts=True,
+    )
 
-    if user_stats_exists or corp_stats_exists:
-        logger.warning(f"Data for {month}/{year} already exists. Skipping processing.")
-        logger.debug(
-            f"User stats exist: {user_stats_exists}, Corp stats exist: {corp_stats_exists}"
-        )
-        return
+    return {fleet_type.name: fleet_type for fleet_type in fleet_types.all()}
+
+
+def _read_csv_totals(csv_file, column_mapping):
+    """
+    Sum the mapped columns of every CSV row per account name
 
-    reader = csv.DictReader(csv_data)
+    Rows are read one at a time, the file is never held in memory.
 
-    for row in reader:
+    :return: {account_name: {fleet_type_name: total_fats}}
+    """
+    account_totals = defaultdict(lambda: defaultdict(int))
+
+    for row in csv.DictReader(csv_file):
         try:
             account_name = row["Account"]
         except KeyError:
             continue
 
-        try:
-            character = EveonlineEvecharacter.objects.get(character_name=account_name)
-            ownership = AuthenticationCharacterownership.objects.get(
-                character=character
-            )
-            user = ownership.user
-            corporation = character.corporation
-        except (
-            EveonlineEvecharacter.DoesNotExist,
-            AuthenticationCharacterownership.DoesNotExist,
-            EveonlineEvecorporationinfo.DoesNotExist,
-        ):
-            # Handle unknown account
-            unknown_account, created = UnknownAccount.objects.get_or_create(
-                account_name=account_name
-            )
-            if unknown_account.user_id:
-                user = AuthUser.objects.get(id=unknown_account.user_id)
-                corporation = user.profile.main_character.corporation
-            else:
-                logger.warning(f"Unknown account {account_name} not found.")
-                continue
-
         for column, fleet_type_name in column_mapping.items():
             if column in row and row[column]:
                 total_fats = int(row[column])
@@ -83,47 +108,44 @@ def process_csv_task(csv_data, column_mapping, month, year):
                 if total_fats == 0:
                     continue
 
-                fleet_type, created = MonthlyFleetType.objects.get_or_create(
-                    name=fleet_type_name,
-                    source="imp",  # Set the source to 'imp'
-                    month=month,
-                    year=year,
-                )
+                account_totals[account_name][fleet_type_name] += total_fats
 
-                user_stats, created = MonthlyUserStats.objects.get_or_create(
-                    user_id=user.id,
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                    defaults={"total_fats": total_fats},
-                )
+    return account_totals
 
-                if not created:
-                    user_stats.total_fats += total_fats
-                    user_stats.save()
 
-                corp_stats, created = MonthlyCorpStats.objects.get_or_create(
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                    defaults={"total_fats": total_fats},
-                )
+def _resolve_csv_accounts(account_names):
+    """
+    Resolve account names to (user_id, corporation_id)
 
-                if not created:
-                    corp_stats.total_fats += total_fats
-                    corp_stats.save()
+    Accounts that can't be resolved are left out.
+    """
+    resolved = {}
+    for account_name, account in identity.resolve_many(account_names).items():
+        if account is None:
+            logger.warning(f"Unknown account {account_name} not found.")
+        elif not account.corporation_known:
+            logger.warning(
+                f"No main corporation found for user {account.user_id} of {account_name}."
+            )
+        else:
+            resolved[account_name] = (account.user_id, account.corporation_id)
+
+    return resolved
 
 
 @shared_task
-def process_afat_data_task(month, year):
-    # Check for existing data for the given month and year
+def process_csv_task(csv_path, column_mapping, month, year):
+    """
+    Store the IMP stats of a month from an uploaded CSV file
+
+    :param csv_path: storage name of the file from uploads.save_csv_upload,
+        the file is deleted once it is read
+    """
     user_stats_exists = MonthlyUserStats.objects.filter(
-        month=month, year=year, fleet_type__source="afat"
+        month=month, year=year, fleet_type__source="imp"
     ).exists()
     corp_stats_exists = MonthlyCorpStats.objects.filter(
-        month=month, year=year, fleet_type__source="afat"
+        month=month, year=year, fleet_type__source="imp"
     ).exists()
 
     if user_stats_exists or corp_stats_exists:
@@ -131,187 +153,812 @@ def process_afat_data_task(month, year):
         logger.debug(
             f"User stats exist: {user_stats_exists}, Corp stats exist: {corp_stats_exists}"
         )
+        delete_csv_upload(csv_path)
         return
 
-    start_date = datetime(year, month, 1)
-    end_date = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+    timings = {}
+    started = time.perf_counter()
+
+    try:
+        with open_csv_upload(csv_path) as csv_file:
+            account_totals = _read_csv_totals(csv_file, column_mapping)
+    finally:
+        delete_csv_upload(csv_path)
+    timings["read"] = time.perf_counter() - started
+
+    accounts = _resolve_csv_accounts(list(account_totals))
+    timings["resolve"] = time.perf_counter() - started - sum(timings.values())
+
+    # A user is stored against the corporation of the first character seen,
+    # corporation totals follow the corporation of each character.
+    user_counts = {}
+    user_corporations = {}
+    corp_counts = defaultdict(int)
+    for account_name, fleet_totals in account_totals.items():
+        if account_name not in accounts:
+            continue
 
-    # Create necessary fleet types
-    afat_fleet_types = AfatFleettype.objects.all()
-    for afat_fleet_type in afat_fleet_types:
-        MonthlyFleetType.objects.get_or_create(
-            name=afat_fleet_type.name,
-            source="afat",
-            month=month,
-            year=year,
+        user_id, corporation_id = accounts[account_name]
+        user_corporations.setdefault(user_id, corporation_id)
+        for fleet_type_name, total_fats in fleet_totals.items():
+            key = (user_id, fleet_type_name)
+            user_counts[key] = user_counts.get(key, 0) + total_fats
+            corp_counts[(corporation_id, fleet_type_name)] += total_fats
+    timings["aggregate"] = time.perf_counter() - started - sum(timings.values())
+
+    with transaction.atomic():
+        fleet_types = _ensure_fleet_types(
+            [fleet_type_name for _, fleet_type_name in corp_counts],
+            "imp",
+            month,
+            year,
         )
+        MonthlyUserStats.objects.bulk_create(
+            [
+                MonthlyUserStats(
+                    user_id=user_id,
+                    corporation_id=user_corporations[user_id],
+                    month=month,
+                    year=year,
+                    period=month_period(month, year),
+                    fleet_type=fleet_types[fleet_type_name],
+                    total_fats=total,
+                )
+                for (user_id, fleet_type_name), total in user_counts.items()
+            ]
+        )
+        MonthlyCorpStats.objects.bulk_create(
+            [
+                MonthlyCorpStats(
+                    corporation_id=corporation_id,
+                    month=month,
+                    year=year,
+                    period=month_period(month, year),
+                    fleet_type=fleet_types[fleet_type_name],
+                    total_fats=total,
+                )
+                for (corporation_id, fleet_type_name), total in corp_counts.items()
+            ]
+        )
+        snapshot_corp_membership(month, year)
+        rebuild_corp_totals(month, year)
+    chart_cache.bump_data_version(month, year)
+    render_month_charts.delay(month, year)
+    timings["write"] = time.perf_counter() - started - sum(timings.values())
+
+    logger.info(
+        f"IMP data for {month}/{year}: {len(account_totals)} accounts, "
+        f"{len(accounts)} resolved, {len(user_counts)} user stats, "
+        f"{len(corp_counts)} corp stats. "
+        + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items())
+    )
 
-    # Create the "unknown" fleet type
-    unknown_fleet_type, _ = MonthlyFleetType.objects.get_or_create(
-        name="Unknown",
-        source="afat",
-        month=month,
-        year=year,
+
+def _extract_afat_fats(month, year, after_id=0, up_to_id=None, shard=None):
+    """
+    Load the month's fats from the secondary database into a local working set
+
+    The fats are counted by the database per character and fleet type, the
+    characters are resolved to their owner and main through the identity
+    cache, so repeat runs don't query the secondary database for them again.
+
+    :param after_id: only load fats with a higher id
+    :param up_to_id: only load fats up to and including this id
+    :param shard: (start, end) datetimes of the part of the month to load,
+        the whole month if not given
+    :return: (fat_counts, identities, last_fat_id) where fat_counts are
+        (character_id, fleet_type_name, total) tuples, identities maps
+        character ids to their Identity and last_fat_id is the newest fat id
+        counted, 0 if there are none
+    """
+    start_date, end_date = shard or _month_range(month, year)
+
+    fats = AfatFat.objects.filter(
+        fatlink__created__gte=start_date,
+        fatlink__created__lt=end_date,
+        id__gt=after_id,
+    )
+    if up_to_id is not None:
+        fats = fats.filter(id__lte=up_to_id)
+
+    # Streamed in chunks as narrow tuples, no model instances are cached
+    fat_counts = []
+    last_fat_id = 0
+    for character_id, fleet_type_name, total, last_id in (
+        fats.values_list("character_id", "fatlink__link_type__name")
+        .annotate(total=Count("id"), last_id=Max("id"))
+        .order_by()
+        .iterator(chunk_size=LAWN_STATS_AFAT_CHUNK_SIZE)
+    ):
+        fat_counts.append((character_id, fleet_type_name, total))
+        last_fat_id = max(last_fat_id, last_id)
+
+    identities = identity.resolve_many(
+        {character_id for character_id, _, _ in fat_counts}
     )
 
-    afat_fats = AfatFat.objects.filter(
-        fatlink__created__gte=start_date, fatlink__created__lt=end_date
+    return fat_counts, identities, last_fat_id
+
+
+def _aggregate_afat_fats(month, year, after_id=0, up_to_id=None, shard=None):
+    """
+    Count the month's fats per (user, main corporation, fleet type name)
+
+    Fats whose main is not in STATS_ALLIANCE_ID or whose main corporation
+    is unknown are left out, same as the per fat processing did.
+
+    :param after_id: only count fats with a higher id
+    :param up_to_id: only count fats up to and including this id
+    :param shard: (start, end) datetimes of the part of the month to count
+    :return: (user_counts, last_fat_id), the counts and the newest fat id
+        they include, so the watermark matches the counts exactly
+    """
+    fat_counts, identities, last_fat_id = _extract_afat_fats(
+        month, year, after_id, up_to_id, shard
     )
 
-    for afat_fat in afat_fats:
-        try:
-            character = afat_fat.character
+    user_counts = defaultdict(int)
+    for character_id, fleet_type_name, total in fat_counts:
+        character = identities[character_id]
+        if character is None:
+            logger.debug(f"Skipping character {character_id} - No ownership.")
+            continue
+
+        if character.alliance_id != settings.STATS_ALLIANCE_ID:
             logger.debug(
-                f"Processing character: {character.character_name} (ID: {character.character_id})"
+                f"Skipping character {character_id} - Main not in the specified alliance."
             )
+            continue
 
-            ownership = AuthenticationCharacterownership.objects.get(
-                character=character
+        if not character.corporation_known:
+            logger.error(
+                f"Corporation {character.corporation_id} not found for main of user {character.user_id}."
             )
-            user = ownership.user
-            main_character = user.profile.main_character
+            continue
+
+        fleet_type_name = fleet_type_name or "Unknown"
+        user_counts[
+            (character.user_id, character.corporation_id, fleet_type_name)
+        ] += total
+
+    return user_counts, last_fat_id
+
+
+def _count_created_fleets(month, year, after=None, up_to=None, shard=None):
+    """
+    Count the month's fatlinks per (creator, fleet type name)
+
+    :param after: only count fatlinks created after this time
+    :param up_to: only count fatlinks created up to and including this time
+    :param shard: (start, end) datetimes of the part of the month to count
+    :return: (creator_counts, last_fatlink_created), the counts and the newest
+        fatlink creation time they include, None if there are none
+    """
+    start_date, end_date = shard or _month_range(month, year)
+
+    fatlinks = AfatFatlink.objects.filter(created__gte=start_date, created__lt=end_date)
+    if after is not None:
+        fatlinks = fatlinks.filter(created__gt=after)
+    if up_to is not None:
+        fatlinks = fatlinks.filter(created__lte=up_to)
+
+    created_counts = (
+        fatlinks.values_list("creator_id", "link_type__name")
+        .annotate(total=Count("id"), last_created=Max("created"))
+        .order_by()
+        .iterator(chunk_size=LAWN_STATS_AFAT_CHUNK_SIZE)
+    )
+
+    creator_counts = defaultdict(int)
+    last_fatlink_created = None
+    for creator_id, fleet_type_name, total, last_created in created_counts:
+        creator_counts[(creator_id, fleet_type_name or "Unknown")] += total
+        if last_fatlink_created is None or last_created > last_fatlink_created:
+            last_fatlink_created = last_created
+
+    return creator_counts, last_fatlink_created
+
+
+def _afat_high_water_marks(month, year):
+    """Return the newest fat id and fatlink creation time of the month"""
+    start_date, end_date = _month_range(month, year)
+
+    last_fat_id = AfatFat.objects.filter(
+        fatlink__created__gte=start_date, fatlink__created__lt=end_date
+    ).aggregate(last=Max("id"))["last"]
+    last_fatlink_created = AfatFatlink.objects.filter(
+        created__gte=start_date, created__lt=end_date
+    ).aggregate(last=Max("created"))["last"]
+
+    return last_fat_id or 0, last_fatlink_created
+
+
+def _month_shards(month, year, shards):
+    """Split the month into up to shards consecutive (start, end) day ranges"""
+    start_date, end_date = _month_range(month, year)
+    days = (end_date - start_date).days
+    shards = max(1, min(shards, days))
+    bounds = [
+        start_date + timedelta(days=days * shard // shards) for shard in range(shards)
+    ]
+    return list(zip(bounds, bounds[1:] + [end_date]))
+
 
-            if not main_character or not main_character.alliance:
-                logger.debug(
-                    f"Skipping character: {character.character_name} - No main character or alliance."
+def _corp_counts(user_counts):
+    """Sum (user, corporation, fleet type) counts up per (corporation, fleet type)"""
+    corp_counts = defaultdict(int)
+    for (_, corporation_id, fleet_type_name), total in user_counts.items():
+        corp_counts[(corporation_id, fleet_type_name)] += total
+    return corp_counts
+
+
+def _month_is_open(month, year):
+    now = datetime.now()
+    return (year, month) >= (now.year, now.month)
+
+
+def _max_rss():
+    """Return the peak resident memory of the process in bytes, or None"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes, except on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@contextmanager
+def _process_memory():
+    """
+    Measure the peak resident memory of the process around the block
+
+    Reading it is cheap and includes memory allocated outside of Python,
+    like the result buffers of the database driver. It covers the whole
+    process, and the increase only shows runs that went past the highest
+    peak the process had before.
+
+    :return: dict whose "peak" is set to a readable figure on exit
+    """
+    memory = {"peak": "unknown"}
+    start = _max_rss()
+    try:
+        yield memory
+    finally:
+        end = _max_rss()
+        if end is not None:
+            memory["peak"] = f"{end / 2**20:.1f} MiB (+{(end - start) / 2**20:.1f} MiB)"
+
+
+@shared_task
+def snapshot_corp_membership(month, year):
+    """
+    Store the number of mains per alliance corp for a month
+
+    The snapshot is taken again while the month is open. Closed months keep
+    theirs, so their relative participation doesn't follow today's members.
+    """
+    period = month_period(month, year)
+    if (
+        not _month_is_open(month, year)
+        and MonthlyCorpMembership.objects.filter(period=period).exists()
+    ):
+        return
+
+    alliance_corps = EveonlineEvecorporationinfo.objects.filter(
+        alliance__alliance_id=settings.STATS_ALLIANCE_ID
+    ).values("corporation_id")
+    main_counts = (
+        AuthenticationUserprofile.objects.filter(
+            main_character__corporation_id__in=alliance_corps
+        )
+        .values("main_character__corporation_id")
+        .annotate(total=Count("pk"))
+        .values_list("main_character__corporation_id", "total")
+    )
+
+    with transaction.atomic():
+        MonthlyCorpMembership.objects.filter(period=period).delete()
+        MonthlyCorpMembership.objects.bulk_create(
+            [
+                MonthlyCorpMembership(
+                    corporation_id=corporation_id, period=period, main_count=total
                 )
-                continue
+                for corporation_id, total in main_counts
+            ]
+        )
+
 
-            if main_character.alliance.alliance_id != settings.STATS_ALLIANCE_ID:
-                logger.debug(
-                    f"Skipping character: {character.character_name} - Not in the specified alliance."
+@shared_task
+def rebuild_corp_totals(month, year):
+    """Rebuild the MonthlyCorpTotals of a month from its MonthlyCorpStats"""
+    period = month_period(month, year)
+    totals = list(
+        MonthlyCorpStats.objects.filter(period=period)
+        .values_list("corporation_id", "fleet_type__source")
+        .annotate(total=Sum("total_fats"))
+        .order_by()
+    )
+    main_counts = dict(
+        MonthlyCorpMembership.objects.filter(period=period).values_list(
+            "corporation_id", "main_count"
+        )
+    )
+
+    with transaction.atomic():
+        MonthlyCorpTotals.objects.filter(period=period).delete()
+        MonthlyCorpTotals.objects.bulk_create(
+            [
+                MonthlyCorpTotals(
+                    corporation_id=corporation_id,
+                    period=period,
+                    source=source,
+                    total_fats=total,
+                    main_count=main_counts.get(corporation_id, 0),
                 )
-                continue
+                for corporation_id, source, total in totals
+            ]
+        )
 
-            corporation = main_character.corporation
-            logger.debug(
-                f"Character {character.character_name} belongs to corporation: {corporation.corporation_name}"
-            )
 
-        except EveonlineEvecharacter.DoesNotExist:
-            logger.error(
-                f"EveonlineEvecharacter.DoesNotExist: Character {character.character_name} not found."
+def _increment_stats(model, field, rows):
+    """
+    Add totals onto existing stats rows with an atomic F() update,
+    creating the rows that don't exist yet
+
+    :param rows: iterable of (lookup, defaults, total)
+    """
+    missing = []
+    for lookup, defaults, total in rows:
+        updated = model.objects.filter(**lookup).update(**{field: F(field) + total})
+        if not updated:
+            missing.append(model(**lookup, **defaults, **{field: total}))
+    model.objects.bulk_create(missing)
+
+
+def _store_afat_stats(month, year, user_counts, last_fat_id, fleet_types):
+    """
+    Write the AFAT user and corp stats of a month, call in a transaction
+
+    :return: the corp counts written
+    """
+    corp_counts = _corp_counts(user_counts)
+
+    MonthlyUserStats.objects.bulk_create(
+        [
+            MonthlyUserStats(
+                user_id=user_id,
+                corporation_id=corporation_id,
+                month=month,
+                year=year,
+                period=month_period(month, year),
+                fleet_type=fleet_types[fleet_type_name],
+                total_fats=total,
             )
-            continue
-        except AuthenticationCharacterownership.DoesNotExist:
-            logger.error(
-                f"AuthenticationCharacterownership.DoesNotExist: Ownership not found for character {character.character_name}."
-            )
-            continue
-        except EveonlineEvecorporationinfo.DoesNotExist:
-            logger.error(
-                f"EveonlineEvecorporationinfo.DoesNotExist: Corporation not found for main character {main_character.character_name}."
+            for (user_id, corporation_id, fleet_type_name), total in user_counts.items()
+        ]
+    )
+    MonthlyCorpStats.objects.bulk_create(
+        [
+            MonthlyCorpStats(
+                corporation_id=corporation_id,
+                month=month,
+                year=year,
+                period=month_period(month, year),
+                fleet_type=fleet_types[fleet_type_name],
+                total_fats=total,
             )
-            continue
-        except AuthenticationUserprofile.DoesNotExist:
-            logger.error(
-                f"AuthenticationUserprofile.DoesNotExist: User profile not found for user {user.username}."
+            for (corporation_id, fleet_type_name), total in corp_counts.items()
+        ]
+    )
+    MonthlyAfatWatermark.objects.update_or_create(
+        month=month, year=year, defaults={"last_fat_id": last_fat_id}
+    )
+    snapshot_corp_membership(month, year)
+    rebuild_corp_totals(month, year)
+
+    return corp_counts
+
+
+def _store_creator_stats(month, year, creator_counts, last_fatlink_created):
+    """Write the creator stats of a month, call in a transaction"""
+    fleet_types = _ensure_fleet_types(
+        [fleet_type_name for _, fleet_type_name in creator_counts],
+        "afat",
+        month,
+        year,
+    )
+    # The month is rebuilt as a whole, so running this twice doesn't double count
+    MonthlyCreatorStats.objects.filter(month=month, year=year).delete()
+    MonthlyCreatorStats.objects.bulk_create(
+        [
+            MonthlyCreatorStats(
+                creator_id=creator_id,
+                month=month,
+                year=year,
+                period=month_period(month, year),
+                fleet_type=fleet_types[fleet_type_name],
+                total_created=total,
             )
-            continue
+            for (creator_id, fleet_type_name), total in creator_counts.items()
+        ]
+    )
+    MonthlyAfatWatermark.objects.update_or_create(
+        month=month,
+        year=year,
+        defaults={"last_fatlink_created": last_fatlink_created},
+    )
 
-        fatlink = afat_fat.fatlink
-        fleet_type_name = fatlink.link_type.name if fatlink.link_type else "Unknown"
 
-        fleet_type = MonthlyFleetType.objects.get(
-            name=fleet_type_name,
-            source="afat",
-            month=month,
-            year=year,
+@shared_task
+def process_afat_data_task(month, year, shards=None):
+    """
+    Store the AFAT stats of a month
+
+    :param shards: day ranges to split the month into, LAWN_STATS_AFAT_SHARDS
+        if not given
+    :return: False if the month already has AFAT stats, or shards of it are
+        already queued, and was skipped
+    """
+    if shards is None:
+        shards = LAWN_STATS_AFAT_SHARDS
+
+    if shards > 1 and isinstance(merge_afat_shards.backend, DisabledBackend):
+        logger.warning(
+            f"No celery result backend to merge the shards, processing {month}/{year} "
+            "in one task."
         )
+        shards = 1
 
-        try:
-            with transaction.atomic():
-                # Check for existing user stats entry before attempting to create or update
-                existing_user_stats = MonthlyUserStats.objects.filter(
-                    user_id=user.id,
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                ).first()
-
-                if existing_user_stats:
-                    existing_user_stats.total_fats += 1
-                    existing_user_stats.save()
-                else:
-                    MonthlyUserStats.objects.create(
-                        user_id=user.id,
-                        corporation_id=corporation.corporation_id,
-                        month=month,
-                        year=year,
-                        fleet_type=fleet_type,
-                        total_fats=1,
-                    )
-
-                # Check for existing corp stats entry before attempting to create or update
-                existing_corp_stats = MonthlyCorpStats.objects.filter(
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                ).first()
-
-                if existing_corp_stats:
-                    existing_corp_stats.total_fats += 1
-                    existing_corp_stats.save()
-                else:
-                    MonthlyCorpStats.objects.create(
-                        corporation_id=corporation.corporation_id,
-                        month=month,
-                        year=year,
-                        fleet_type=fleet_type,
-                        total_fats=1,
-                    )
-        except IntegrityError as e:
-            logger.error(
-                f"IntegrityError: user ID {user.id}, corp ID {corporation.corporation_id}, and {fleet_type_name}: {e}"
+    # Check for existing data for the given month and year
+    user_stats_exists = MonthlyUserStats.objects.filter(
+        month=month, year=year, fleet_type__source="afat"
+    ).exists()
+    corp_stats_exists = MonthlyCorpStats.objects.filter(
+        month=month, year=year, fleet_type__source="afat"
+    ).exists()
+
+    if user_stats_exists or corp_stats_exists:
+        logger.warning(f"Data for {month}/{year} already exists. Skipping processing.")
+        logger.debug(
+            f"User stats exist: {user_stats_exists}, Corp stats exist: {corp_stats_exists}"
+        )
+        return False
+
+    fleet_types = _ensure_fleet_types(
+        [*AfatFleettype.objects.values_list("name", flat=True), "Unknown"],
+        "afat",
+        month,
+        year,
+    )
+
+    if shards > 1:
+        # Periodic updates keep calling this until the merge wrote the month,
+        # only the first one queues the shards
+        if not cache.add(_shards_lock_key(month, year), True, 60 * 60):
+            logger.info(f"AFAT data for {month}/{year}: shards already queued.")
+            return False
+
+        # The shards count up to the same high-water marks, so the watermark
+        # matches the merged counts exactly
+        last_fat_id, last_fatlink_created = _afat_high_water_marks(month, year)
+        up_to = last_fatlink_created and last_fatlink_created.isoformat()
+        day_ranges = _month_shards(month, year, shards)
+        chord(
+            aggregate_afat_shard.s(
+                month, year, start.isoformat(), end.isoformat(), last_fat_id, up_to
             )
-            continue
+            for start, end in day_ranges
+        )(merge_afat_shards.s(month, year, last_fat_id, up_to))
+        logger.info(f"AFAT data for {month}/{year}: queued {len(day_ranges)} shards.")
+        return True
+
+    with _process_memory() as memory:
+        user_counts, last_fat_id = _aggregate_afat_fats(month, year)
+
+        with transaction.atomic():
+            corp_counts = _store_afat_stats(
+                month, year, user_counts, last_fat_id, fleet_types
+            )
+
+    chart_cache.bump_data_version(month, year)
+
+    logger.info(
+        f"AFAT data for {month}/{year}: {sum(user_counts.values())} fats, "
+        f"{len(user_counts)} user stats, {len(corp_counts)} corp stats, "
+        f"peak memory of the worker {memory['peak']}."
+    )
 
     # Process creator stats
     process_creator_stats(month, year)
+    return True
+
+
+def _shards_lock_key(month, year):
+    return f"lawn_stats:afat_shards:{year}:{month:02d}"
+
+
+@shared_task
+def aggregate_afat_shard(month, year, start, end, up_to_id, up_to_created):
+    """
+    Count the fats and created fleets of one shard of a month
+
+    :param start: ISO start of the shard
+    :param end: ISO end of the shard, exclusive
+    :param up_to_created: ISO creation time of the newest fatlink to count
+    :return: partial counts as lists, merged by merge_afat_shards
+    """
+    shard = (datetime.fromisoformat(start), datetime.fromisoformat(end))
+    up_to = up_to_created and datetime.fromisoformat(up_to_created)
+
+    user_counts, _ = _aggregate_afat_fats(month, year, up_to_id=up_to_id, shard=shard)
+    creator_counts, _ = _count_created_fleets(month, year, up_to=up_to, shard=shard)
+
+    logger.debug(
+        f"AFAT shard {start} - {end}: {sum(user_counts.values())} fats, "
+        f"{sum(creator_counts.values())} fleets."
+    )
+    return {
+        "user_counts": [[*key, total] for key, total in user_counts.items()],
+        "creator_counts": [[*key, total] for key, total in creator_counts.items()],
+    }
+
+
+@shared_task
+def merge_afat_shards(results, month, year, last_fat_id, last_fatlink_created):
+    """Merge the partial counts of the shards and write the month at once"""
+    try:
+        _merge_afat_shards(results, month, year, last_fat_id, last_fatlink_created)
+    finally:
+        cache.delete(_shards_lock_key(month, year))
+
+
+def _merge_afat_shards(results, month, year, last_fat_id, last_fatlink_created):
+    if MonthlyAfatWatermark.objects.filter(month=month, year=year).exists():
+        logger.warning(f"Data for {month}/{year} already exists. Skipping the merge.")
+        return
+
+    with _process_memory() as memory:
+        user_counts = defaultdict(int)
+        user_corporations = {}
+        creator_counts = defaultdict(int)
+        for result in results:
+            for user_id, corporation_id, name, total in result["user_counts"]:
+                # The shards resolve the mains on their own, a main that moved
+                # in between must not store the user against two corporations
+                corporation_id = user_corporations.setdefault(user_id, corporation_id)
+                user_counts[(user_id, corporation_id, name)] += total
+            for creator_id, name, total in result["creator_counts"]:
+                creator_counts[(creator_id, name)] += total
+
+        if last_fatlink_created is not None:
+            last_fatlink_created = datetime.fromisoformat(last_fatlink_created)
+
+        with transaction.atomic():
+            fleet_types = _ensure_fleet_types(
+                [fleet_type_name for _, _, fleet_type_name in user_counts],
+                "afat",
+                month,
+                year,
+            )
+            corp_counts = _store_afat_stats(
+                month, year, user_counts, last_fat_id, fleet_types
+            )
+            _store_creator_stats(month, year, creator_counts, last_fatlink_created)
+
+    chart_cache.bump_data_version(month, year)
+    render_month_charts.delay(month, year)
+
+    logger.info(
+        f"AFAT data for {month}/{year}: {sum(user_counts.values())} fats, "
+        f"{len(user_counts)} user stats, {len(corp_counts)} corp stats, "
+        f"{sum(creator_counts.values())} fleets from {len(results)} shards, "
+        f"peak memory of the worker {memory['peak']}."
+    )
 
 
 @shared_task
 def process_creator_stats(month, year):
-    start_date = datetime(year, month, 1)
-    end_date = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+    creator_counts, last_fatlink_created = _count_created_fleets(month, year)
 
-    afat_fatlinks = AfatFatlink.objects.filter(
-        created__gte=start_date, created__lt=end_date
+    with transaction.atomic():
+        _store_creator_stats(month, year, creator_counts, last_fatlink_created)
+
+    chart_cache.bump_data_version(month, year)
+    render_month_charts.delay(month, year)
+
+    logger.info(
+        f"Creator stats for {month}/{year}: {sum(creator_counts.values())} fleets, "
+        f"{len(creator_counts)} creator stats."
     )
 
-    for fatlink in afat_fatlinks:
-        creator = fatlink.creator
-        fleet_type_name = fatlink.link_type.name if fatlink.link_type else "Unknown"
 
-        fleet_type = MonthlyFleetType.objects.get(
-            name=fleet_type_name,
-            source="afat",
-            month=month,
-            year=year,
+@shared_task
+def update_afat_data_task(month, year):
+    """
+    Apply the fats and fatlinks added since the last run for the month
+    as counter increments
+
+    Months without a watermark get a full run first.
+    """
+    if not MonthlyAfatWatermark.objects.filter(month=month, year=year).exists():
+        if MonthlyUserStats.objects.filter(
+            month=month, year=year, fleet_type__source="afat"
+        ).exists():
+            logger.warning(
+                f"Data for {month}/{year} was processed without a watermark. "
+                "Clear and process the month again to enable incremental updates."
+            )
+            return
+
+        process_afat_data_task(month, year)
+        return
+
+    with _process_memory() as memory, transaction.atomic():
+        watermark = MonthlyAfatWatermark.objects.select_for_update().get(
+            month=month, year=year
+        )
+        user_counts, last_fat_id = _aggregate_afat_fats(
+            month, year, after_id=watermark.last_fat_id
+        )
+        corp_counts = _corp_counts(user_counts)
+        creator_counts, last_fatlink_created = _count_created_fleets(
+            month, year, after=watermark.last_fatlink_created
         )
 
-        try:
+        fleet_types = _ensure_fleet_types(
+            [fleet_type_name for _, fleet_type_name in corp_counts]
+            + [fleet_type_name for _, fleet_type_name in creator_counts],
+            "afat",
+            month,
+            year,
+        )
+        month_fields = {
+            "month": month,
+            "year": year,
+            "period": month_period(month, year),
+        }
+
+        _increment_stats(
+            MonthlyUserStats,
+            "total_fats",
+            (
+                (
+                    {
+                        "user_id": user_id,
+                        "fleet_type": fleet_types[name],
+                        **month_fields,
+                    },
+                    {"corporation_id": corporation_id},
+                    total,
+                )
+                for (user_id, corporation_id, name), total in user_counts.items()
+            ),
+        )
+        _increment_stats(
+            MonthlyCorpStats,
+            "total_fats",
+            (
+                (
+                    {
+                        "corporation_id": corporation_id,
+                        "fleet_type": fleet_types[name],
+                        **month_fields,
+                    },
+                    {},
+                    total,
+                )
+                for (corporation_id, name), total in corp_counts.items()
+            ),
+        )
+        _increment_stats(
+            MonthlyCreatorStats,
+            "total_created",
+            (
+                (
+                    {
+                        "creator_id": creator_id,
+                        "fleet_type": fleet_types[name],
+                        **month_fields,
+                    },
+                    {},
+                    total,
+                )
+                for (creator_id, name), total in creator_counts.items()
+            ),
+        )
+
+        if corp_counts:
+            snapshot_corp_membership(month, year)
+            rebuild_corp_totals(month, year)
+
+        watermark.last_fat_id = max(last_fat_id, watermark.last_fat_id)
+        if last_fatlink_created is not None:
+            watermark.last_fatlink_created = last_fatlink_created
+        watermark.save()
+
+    if user_counts or creator_counts:
+        chart_cache.bump_data_version(month, year)
+        render_month_charts.delay(month, year)
+
+    logger.info(
+        f"AFAT update for {month}/{year}: {sum(user_counts.values())} new fats, "
+        f"{sum(creator_counts.values())} new fleets, "
+        f"peak memory of the worker {memory['peak']}."
+    )
+
+
+@shared_task
+def backfill_month(month, year, source="afat", clear=False):
+    """
+    Rebuild the stats of one month, run by the backfill_stats command
+
+    AFAT months are processed again from the AFAT data in this task, the
+    months are already run in parallel. IMP stats only come from uploaded
+    CSV files, for them the tables derived from the stats are rebuilt.
+
+    :param clear: remove the month's AFAT stats first, months that have
+        them are skipped otherwise
+    :return: seconds the month took, None if it was skipped
+    """
+    started = time.perf_counter()
+
+    if source == "afat":
+        if clear:
             with transaction.atomic():
-                # Check for existing creator stats entry before attempting to create or update
-                existing_creator_stats = MonthlyCreatorStats.objects.filter(
-                    creator_id=creator.id, month=month, year=year, fleet_type=fleet_type
-                ).first()
-
-                if existing_creator_stats:
-                    existing_creator_stats.total_created += 1
-                    existing_creator_stats.save()
-                else:
-                    MonthlyCreatorStats.objects.create(
-                        creator_id=creator.id,
-                        month=month,
-                        year=year,
-                        fleet_type=fleet_type,
-                        total_created=1,
-                    )
-        except IntegrityError as e:
-            logger.error(
-                f"IntegrityError processing creator ID {creator.id}, and fleet type {fleet_type_name}: {e}"
-            )
-            continue
+                # Deletes the user, corp and creator stats of the fleet types
+                MonthlyFleetType.objects.filter(
+                    month=month, year=year, source="afat"
+                ).delete()
+                MonthlyAfatWatermark.objects.filter(month=month, year=year).delete()
+        if not process_afat_data_task(month, year, shards=1):
+            return None
+    else:
+        with transaction.atomic():
+            snapshot_corp_membership(month, year)
+            rebuild_corp_totals(month, year)
+        chart_cache.bump_data_version(month, year)
+
+    return time.perf_counter() - started
+
+
+@shared_task
+def update_current_month_afat_data():
+    """
+    Periodic task keeping the current month's AFAT stats up to date
+
+    During the first LAWN_STATS_PREVIOUS_MONTH_UPDATE_DAYS days of a month
+    the previous month is updated as well, fats are often added to the last
+    fleets of a month after it ended.
+    """
+    now = datetime.now()
+    if now.day <= LAWN_STATS_PREVIOUS_MONTH_UPDATE_DAYS:
+        previous = now.replace(day=1) - timedelta(days=1)
+        update_afat_data_task(previous.month, previous.year)
+
+    update_afat_data_task(now.month, now.year)
+
+
+@shared_task
+def cleanup_csv_uploads():
+    """Periodic task deleting CSV uploads that were never processed"""
+    deleted = delete_old_csv_uploads(LAWN_STATS_CSV_UPLOAD_MAX_AGE)
+    if deleted:
+        logger.info(f"Deleted {deleted} abandoned CSV uploads.")
+
+
+@shared_task
+def render_month_charts(month, year, sections=None):
+    """
+    Render the chart sections of a month into the chart cache
+
+    Sections after the first are queued as their own tasks, so free workers
+    render them in parallel.
+
+    :param sections: names of the sections to render, all if not given
+    """
+    names = [name for name in CHART_SECTIONS if sections is None or name in sections]
+    for name in names[1:]:
+        render_month_charts.delay(month, year, [name])
+
+    if names:
+        render, months = CHART_SECTIONS[names[0]]
+        chart_cache.get_or_render(names[0], month, year, render, months)
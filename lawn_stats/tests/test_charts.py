@@ -0,0 +1,132 @@
+"""
+Tests for the chart specs of the all_charts sections
+"""
+
+# AA lawn_stats
+from lawn_stats import charts
+from lawn_stats.models import MonthlyCorpMembership
+from lawn_stats.tasks import process_afat_data_task
+from lawn_stats.tests.utils import AfatTestCase
+
+TREND = [(2023, 12), (2024, 1), (2024, 2), (2024, 3), (2024, 4), (2024, 5)]
+
+
+class TestChartSpecs(AfatTestCase):
+    """
+    Chart specs of 05/2024, with the AFAT stats of 04/2024 for the trends
+    """
+
+    def setUp(self) -> None:
+        """
+        Process the AFAT data of the months
+        :return:
+        :rtype:
+        """
+
+        super().setUp()
+
+        process_afat_data_task(4, 2024, shards=1)
+        process_afat_data_task(5, 2024, shards=1)
+
+    def specs(self, chart_specs):
+        """
+        The kwargs of the chart specs by chart name
+        :return:
+        :rtype: dict
+        """
+
+        return {name: kwargs for name, _, kwargs in chart_specs(5, 2024)}
+
+    def test_alliance_chart_specs(self):
+        """
+        The alliance charts show the fats of each corp
+        :return:
+        :rtype:
+        """
+
+        specs = self.specs(charts.alliance_chart_specs)
+
+        self.assertEqual(specs["afat_chart"]["corp_names"], ["2001", "2002"])
+        self.assertEqual(
+            specs["afat_chart"]["columns"],
+            {"Peacetime": [1, 1], "Strategic": [1, 1], "Unknown": [1, 1]},
+        )
+        self.assertEqual(specs["imp_chart"]["columns"], {})
+        self.assertEqual(specs["combined_chart"]["total_afat"], [3, 3])
+        self.assertEqual(specs["combined_chart"]["total_imp"], [0, 0])
+        self.assertEqual(
+            dict(zip(specs["pie_chart"]["labels"], specs["pie_chart"]["totals"])),
+            {"Peacetime": 2, "Strategic": 2, "Unknown": 2},
+        )
+        self.assertEqual(specs["line_chart"]["date_range"], TREND)
+        self.assertEqual(specs["line_chart"]["totals"], [0, 0, 0, 0, 2, 6])
+        self.assertEqual(specs["relative_chart"]["afat"], [3, 3])
+        self.assertEqual(specs["relative_chart"]["imp"], [0, 0])
+
+    def test_relative_chart_without_membership_snapshot(self):
+        """
+        The relative participation is left out with a warning instead of
+        drawn as zero when the month has no membership snapshot
+        :return:
+        :rtype:
+        """
+
+        MonthlyCorpMembership.objects.filter(period=202405).delete()
+
+        with self.assertLogs(charts.logger, "WARNING"):
+            specs = self.specs(charts.alliance_chart_specs)
+
+        self.assertNotIn("relative_chart", specs)
+        self.assertIn("afat_chart", specs)
+
+    def test_corp_chart_specs(self):
+        """
+        Every corp has a breakdown of the fats of its mains and a trend
+        :return:
+        :rtype:
+        """
+
+        specs = self.specs(charts.corp_chart_specs)
+
+        self.assertEqual(
+            list(specs), ["Corp 2001", "Corp 2001_line", "Corp 2002", "Corp 2002_line"]
+        )
+        self.assertEqual(specs["Corp 2001"]["users"], ["Character 11"])
+        self.assertEqual(
+            specs["Corp 2001"]["afat_columns"],
+            {"Peacetime": [1], "Strategic": [1], "Unknown": [1]},
+        )
+        self.assertEqual(specs["Corp 2001"]["imp_columns"], {})
+        self.assertEqual(specs["Corp 2002"]["users"], ["Character 21"])
+        self.assertEqual(specs["Corp 2001_line"]["date_range"], TREND)
+        self.assertEqual(specs["Corp 2001_line"]["totals_afat"], [0, 0, 0, 0, 1, 3])
+        self.assertEqual(specs["Corp 2002_line"]["totals_afat"], [0, 0, 0, 0, 1, 3])
+        self.assertEqual(specs["Corp 2002_line"]["totals_imp"], [0] * 6)
+
+    def test_raw_data_view(self):
+        """
+        The raw data lists the totals of the mains of every corp
+        :return:
+        :rtype:
+        """
+
+        data = charts.raw_data_view(5, 2024)
+
+        self.assertEqual(
+            data["raw_data"],
+            {
+                "Corp 2001": [
+                    {"name": "Character 11", "afat_total": 3, "imp_total": 0}
+                ],
+                "Corp 2002": [
+                    {"name": "Character 21", "afat_total": 3, "imp_total": 0}
+                ],
+            },
+        )
+        self.assertEqual(
+            [user["name"] for user in data["top_afat_users"]],
+            ["Character 11", "Character 21"],
+        )
+        self.assertEqual(
+            [user["combined_total"] for user in data["top_combined_users"]], [3, 3]
+        )
@@ -0,0 +1,153 @@
+"""
+Tests for the cached identity resolution
+"""
+
+# Standard Library
+import time
+from unittest import mock
+
+# AA lawn_stats
+from lawn_stats import identity
+from lawn_stats.app_settings import LAWN_STATS_IDENTITY_CACHE_TIMEOUT
+from lawn_stats.models import EveonlineEvecharacter, MonthlyUserStats
+from lawn_stats.tasks import (
+    merge_afat_shards,
+    process_afat_data_task,
+    update_afat_data_task,
+)
+from lawn_stats.tests.utils import AfatTestCase, secondary_db
+
+
+class TestIdentity(AfatTestCase):
+    """
+    TestIdentity
+    """
+
+    def move_main(self, corporation_id):
+        """
+        Move the main of user 1 to another corporation
+        :return:
+        :rtype:
+        """
+
+        EveonlineEvecharacter.objects.using(secondary_db(EveonlineEvecharacter)).filter(
+            id=11
+        ).update(corporation_id=corporation_id)
+
+    def user_corporations(self, user_id):
+        """
+        Corporations the AFAT stats of a user are stored against
+        :return:
+        :rtype: set
+        """
+
+        return set(
+            MonthlyUserStats.objects.filter(
+                user_id=user_id, fleet_type__source="afat"
+            ).values_list("corporation_id", flat=True)
+        )
+
+    def test_characters_share_the_main_of_their_user(self):
+        """
+        The alt resolves to the main of the user even when only the main
+        was cached before the main moved
+        :return:
+        :rtype:
+        """
+
+        identity.resolve_many([11])
+        self.move_main(2002)
+
+        identities = identity.resolve_many([11, 12])
+
+        self.assertEqual(identities[11], identities[12])
+
+    def test_stale_main_full_run(self):
+        """
+        A main that moved after its user was cached doesn't store the user
+        against two corporations
+        :return:
+        :rtype:
+        """
+
+        identity.resolve_many([11])
+        self.move_main(2002)
+        self.add_late_fleet()
+
+        process_afat_data_task(5, 2024, shards=1)
+
+        self.assertEqual(self.user_corporations(1), {2001})
+
+    def test_stale_main_incremental(self):
+        """
+        Updates after the main moved keep one stats row per fleet type
+        :return:
+        :rtype:
+        """
+
+        update_afat_data_task(5, 2024)
+        self.move_main(2002)
+        identity.invalidate()
+        self.add_late_fleet()
+
+        update_afat_data_task(5, 2024)
+
+        rows = list(
+            MonthlyUserStats.objects.filter(user_id=1).values_list(
+                "fleet_type__name", flat=True
+            )
+        )
+        self.assertEqual(len(rows), len(set(rows)))
+        self.assertIn(
+            ("Strategic", 4),
+            MonthlyUserStats.objects.filter(user_id=1).values_list(
+                "fleet_type__name", "total_fats"
+            ),
+        )
+
+    def test_merge_keeps_one_corporation_per_user(self):
+        """
+        Shards that resolved a user's main to different corporations are
+        merged into one corporation
+        :return:
+        :rtype:
+        """
+
+        with mock.patch("lawn_stats.tasks.render_month_charts"):
+            merge_afat_shards(
+                [
+                    {"user_counts": [[1, 2001, "Strategic", 2]], "creator_counts": []},
+                    {"user_counts": [[1, 2002, "Strategic", 1]], "creator_counts": []},
+                ],
+                5,
+                2024,
+                0,
+                None,
+            )
+
+        self.assertEqual(
+            list(
+                MonthlyUserStats.objects.values_list(
+                    "user_id", "corporation_id", "total_fats"
+                )
+            ),
+            [(1, 2001, 3)],
+        )
+
+    def test_cached_identities_expire(self):
+        """
+        A moved main is picked up once the cached identities expire, in the
+        process and in the Django cache
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(identity.resolve_many([12])[12].corporation_id, 2001)
+        self.move_main(2002)
+
+        self.assertEqual(identity.resolve_many([12])[12].corporation_id, 2001)
+        with mock.patch(
+            "lawn_stats.identity.time.time",
+            return_value=time.time() + LAWN_STATS_IDENTITY_CACHE_TIMEOUT + 1,
+        ):
+            self.assertEqual(identity.resolve_many([12])[12].corporation_id, 2002)
@@ -0,0 +1,447 @@
+"""
+Tests for the AFAT processing tasks
+"""
+
+# Standard Library
+import os
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+# Third Party
+from celery.backends.base import DisabledBackend
+
+# Django
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import override_settings
+
+# AA lawn_stats
+from lawn_stats.app_settings import LAWN_STATS_CSV_UPLOAD_MAX_AGE
+from lawn_stats.models import MonthlyCorpStats, MonthlyUserStats, UnknownAccount
+from lawn_stats.tasks import (
+    backfill_month,
+    cleanup_csv_uploads,
+    merge_afat_shards,
+    process_afat_data_task,
+    process_csv_task,
+    update_afat_data_task,
+    update_current_month_afat_data,
+)
+from lawn_stats.tests.utils import (
+    AfatTestCase,
+    afat_stats,
+    eager_chord,
+    frozen_datetime,
+)
+from lawn_stats.uploads import save_csv_upload
+
+
+class TestProcessAfatData(AfatTestCase):
+    """
+    TestProcessAfatData
+    """
+
+    def test_counts_fats_per_user_and_main_corporation(self):
+        """
+        Fats count for the user and the corporation of their main, fats of
+        characters without owner, outside the alliance or with an unknown
+        main corporation are left out
+        :return:
+        :rtype:
+        """
+
+        self.add_late_fleet()
+
+        self.assertTrue(process_afat_data_task(5, 2024, shards=1))
+
+        stats = afat_stats(5, 2024)
+        self.assertEqual(
+            stats["users"],
+            [
+                (1, 2001, "Peacetime", 1),
+                (1, 2001, "Strategic", 4),
+                (1, 2001, "Unknown", 1),
+                (2, 2002, "Peacetime", 1),
+                (2, 2002, "Strategic", 2),
+                (2, 2002, "Unknown", 1),
+            ],
+        )
+        self.assertEqual(
+            stats["corps"],
+            [
+                (2001, "Peacetime", 1),
+                (2001, "Strategic", 4),
+                (2001, "Unknown", 1),
+                (2002, "Peacetime", 1),
+                (2002, "Strategic", 2),
+                (2002, "Unknown", 1),
+            ],
+        )
+        self.assertEqual(
+            stats["creators"],
+            [
+                (1, "Peacetime", 1),
+                (1, "Strategic", 1),
+                (2, "Strategic", 1),
+                (2, "Unknown", 1),
+            ],
+        )
+
+    def test_skips_month_with_stats(self):
+        """
+        A month that already has AFAT stats is left as it is
+        :return:
+        :rtype:
+        """
+
+        process_afat_data_task(5, 2024, shards=1)
+        stats = afat_stats(5, 2024)
+        self.add_late_fleet()
+
+        self.assertFalse(process_afat_data_task(5, 2024, shards=1))
+        self.assertEqual(afat_stats(5, 2024), stats)
+
+
+@mock.patch("lawn_stats.tasks.chord", eager_chord)
+class TestShardedAfatData(AfatTestCase):
+    """
+    TestShardedAfatData
+    """
+
+    def setUp(self) -> None:
+        """
+        A result backend for the chord
+        :return:
+        :rtype:
+        """
+
+        super().setUp()
+
+        patcher = mock.patch.object(merge_afat_shards, "_backend", mock.Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sharded_matches_full(self):
+        """
+        The merged shards store the same stats as a full run
+        :return:
+        :rtype:
+        """
+
+        self.add_late_fleet()
+        process_afat_data_task(5, 2024, shards=4)
+        sharded = afat_stats(5, 2024)
+        self.assertIn((1, 2001, "Strategic", 4), sharded["users"])
+
+        backfill_month(5, 2024, clear=True)
+
+        self.assertEqual(sharded, afat_stats(5, 2024))
+
+    def test_sharded_then_incremental(self):
+        """
+        A sharded run leaves a watermark incremental updates continue from
+        :return:
+        :rtype:
+        """
+
+        process_afat_data_task(5, 2024, shards=4)
+        self.add_late_fleet()
+        update_afat_data_task(5, 2024)
+        incremental = afat_stats(5, 2024)
+
+        backfill_month(5, 2024, clear=True)
+
+        self.assertEqual(incremental, afat_stats(5, 2024))
+
+    def test_queued_once(self):
+        """
+        Runs while the shards of the month are queued don't queue them again
+        :return:
+        :rtype:
+        """
+
+        with mock.patch("lawn_stats.tasks.chord") as queued:
+            self.assertTrue(process_afat_data_task(5, 2024, shards=4))
+            self.assertFalse(process_afat_data_task(5, 2024, shards=4))
+
+        self.assertEqual(queued.call_count, 1)
+
+    def test_merge_after_month_was_written(self):
+        """
+        A merge for a month that was written in the meantime leaves it as it is
+        :return:
+        :rtype:
+        """
+
+        process_afat_data_task(5, 2024, shards=4)
+        stats = afat_stats(5, 2024)
+
+        merge_afat_shards(
+            [{"user_counts": [[1, 2001, "Strategic", 1]], "creator_counts": []}],
+            5,
+            2024,
+            0,
+            None,
+        )
+
+        self.assertEqual(afat_stats(5, 2024), stats)
+
+    def test_without_result_backend(self):
+        """
+        Without a result backend the month is processed in one task
+        :return:
+        :rtype:
+        """
+
+        with mock.patch.object(
+            merge_afat_shards, "_backend", DisabledBackend(merge_afat_shards.app)
+        ), mock.patch("lawn_stats.tasks.chord") as queued:
+            process_afat_data_task(5, 2024, shards=4)
+        stats = afat_stats(5, 2024)
+
+        backfill_month(5, 2024, clear=True)
+
+        queued.assert_not_called()
+        self.assertEqual(stats, afat_stats(5, 2024))
+
+
+class TestUpdateAfatData(AfatTestCase):
+    """
+    TestUpdateAfatData
+    """
+
+    def test_incremental_matches_full(self):
+        """
+        Fleets and fats added after a run are counted as if the month was
+        processed at once
+        :return:
+        :rtype:
+        """
+
+        update_afat_data_task(5, 2024)
+        self.add_late_fleet()
+        update_afat_data_task(5, 2024)
+        incremental = afat_stats(5, 2024)
+        self.assertIn((1, 2001, "Strategic", 4), incremental["users"])
+
+        backfill_month(5, 2024, clear=True)
+
+        self.assertEqual(incremental, afat_stats(5, 2024))
+
+    def test_nothing_new(self):
+        """
+        An update without new fats leaves the stats as they are
+        :return:
+        :rtype:
+        """
+
+        update_afat_data_task(5, 2024)
+        stats = afat_stats(5, 2024)
+
+        update_afat_data_task(5, 2024)
+
+        self.assertEqual(afat_stats(5, 2024), stats)
+
+    def test_previous_month_after_rollover(self):
+        """
+        Early in a month the periodic update also counts the fats added late
+        to the previous month
+        :return:
+        :rtype:
+        """
+
+        with mock.patch(
+            "lawn_stats.tasks.datetime", frozen_datetime(datetime(2024, 5, 31, 23))
+        ):
+            update_current_month_afat_data()
+        self.add_late_fleet()
+        with mock.patch(
+            "lawn_stats.tasks.datetime", frozen_datetime(datetime(2024, 6, 1, 0, 5))
+        ):
+            update_current_month_afat_data()
+        incremental = afat_stats(5, 2024)
+        self.assertIn((1, 2001, "Strategic", 4), incremental["users"])
+
+        backfill_month(5, 2024, clear=True)
+
+        self.assertEqual(incremental, afat_stats(5, 2024))
+
+    def test_previous_month_left_later_in_month(self):
+        """
+        Later in a month the periodic update leaves the previous month alone
+        :return:
+        :rtype:
+        """
+
+        with mock.patch(
+            "lawn_stats.tasks.datetime", frozen_datetime(datetime(2024, 5, 31, 23))
+        ):
+            update_current_month_afat_data()
+        stats = afat_stats(5, 2024)
+        self.add_late_fleet()
+        with mock.patch(
+            "lawn_stats.tasks.datetime", frozen_datetime(datetime(2024, 6, 10))
+        ):
+            update_current_month_afat_data()
+
+        self.assertEqual(afat_stats(5, 2024), stats)
+
+
+class TestProcessCsv(AfatTestCase):
+    """
+    TestProcessCsv
+    """
+
+    column_mapping = {"Strat": "Strategic", "Peace": "Peacetime"}
+
+    def setUp(self) -> None:
+        """
+        Uploads go to a temporary media root
+        :return:
+        :rtype:
+        """
+
+        super().setUp()
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        UnknownAccount.objects.create(account_name="Alt Account", user_id=1)
+
+    def upload(self, *rows):
+        """
+        Store a CSV upload with the given rows below the header
+        :return: storage name of the file
+        :rtype: str
+        """
+
+        content = "\n".join(("Account,Strat,Peace",) + rows)
+        return save_csv_upload(ContentFile(content.encode(), name="upload.csv"))
+
+    def imp_stats(self, month, year):
+        """
+        The stored IMP stats of a month
+        :return: sorted user and corporation rows
+        :rtype: dict
+        """
+
+        return {
+            "users": sorted(
+                MonthlyUserStats.objects.filter(
+                    month=month, year=year, fleet_type__source="imp"
+                ).values_list(
+                    "user_id", "corporation_id", "fleet_type__name", "total_fats"
+                )
+            ),
+            "corps": sorted(
+                MonthlyCorpStats.objects.filter(
+                    month=month, year=year, fleet_type__source="imp"
+                ).values_list("corporation_id", "fleet_type__name", "total_fats")
+            ),
+        }
+
+    def test_counts_accounts(self):
+        """
+        Known characters count for their owner and their own corporation,
+        mapped unknown accounts for the user and the corporation of their
+        main. A user is stored against the corporation of the first account
+        seen, unmapped accounts are left out
+        :return:
+        :rtype:
+        """
+
+        csv_path = self.upload(
+            "Character 12,2,", "Alt Account,3,1", "Character 21,1,0", "Nobody,5,"
+        )
+
+        process_csv_task(csv_path, self.column_mapping, 5, 2024)
+
+        self.assertEqual(
+            self.imp_stats(5, 2024),
+            {
+                "users": [
+                    (1, 2002, "Peacetime", 1),
+                    (1, 2002, "Strategic", 5),
+                    (2, 2002, "Strategic", 1),
+                ],
+                "corps": [
+                    (2001, "Peacetime", 1),
+                    (2001, "Strategic", 3),
+                    (2002, "Strategic", 3),
+                ],
+            },
+        )
+        self.assertEqual(
+            list(
+                UnknownAccount.objects.filter(account_name="Nobody").values_list(
+                    "user_id", flat=True
+                )
+            ),
+            [None],
+        )
+
+    def test_unknown_account_first_uses_main_corporation(self):
+        """
+        A user first seen through a mapped unknown account is stored against
+        the corporation of their main
+        :return:
+        :rtype:
+        """
+
+        csv_path = self.upload("Alt Account,3,", "Character 12,2,")
+
+        process_csv_task(csv_path, self.column_mapping, 5, 2024)
+
+        self.assertEqual(self.imp_stats(5, 2024)["users"], [(1, 2001, "Strategic", 5)])
+
+    def test_deletes_upload(self):
+        """
+        The upload is deleted once it is read
+        :return:
+        :rtype:
+        """
+
+        csv_path = self.upload("Character 11,1,")
+        self.assertTrue(default_storage.exists(csv_path))
+
+        process_csv_task(csv_path, self.column_mapping, 5, 2024)
+
+        self.assertFalse(default_storage.exists(csv_path))
+
+    def test_skips_month_with_stats(self):
+        """
+        A second upload for a month with IMP stats is skipped and deleted
+        :return:
+        :rtype:
+        """
+
+        process_csv_task(self.upload("Character 11,1,"), self.column_mapping, 5, 2024)
+        stats = self.imp_stats(5, 2024)
+        csv_path = self.upload("Character 21,4,")
+
+        process_csv_task(csv_path, self.column_mapping, 5, 2024)
+
+        self.assertEqual(self.imp_stats(5, 2024), stats)
+        self.assertFalse(default_storage.exists(csv_path))
+
+    def test_cleanup_deletes_old_uploads(self):
+        """
+        Uploads that were never processed are deleted once they are too old
+        :return:
+        :rtype:
+        """
+
+        old_path = self.upload("Character 11,1,")
+        new_path = self.upload("Character 21,1,")
+        modified = time.time() - LAWN_STATS_CSV_UPLOAD_MAX_AGE - 60
+        os.utime(default_storage.path(old_path), (modified, modified))
+
+        cleanup_csv_uploads()
+
+        self.assertFalse(default_storage.exists(old_path))
+        self.assertTrue(default_storage.exists(new_path))
@@ -0,0 +1,343 @@
+"""
+Test utilities
+"""
+
+# Standard Library
+from datetime import datetime
+from unittest import mock
+
+# Django
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connections, router
+from django.test import TestCase, override_settings
+
+# AA lawn_stats
+from lawn_stats import identity
+from lawn_stats.models import (
+    AfatFat,
+    AfatFatlink,
+    AfatFleettype,
+    AuthenticationCharacterownership,
+    AuthenticationState,
+    AuthenticationUserprofile,
+    AuthUser,
+    EveonlineEveallianceinfo,
+    EveonlineEvecharacter,
+    EveonlineEvecorporationinfo,
+    MonthlyAfatWatermark,
+    MonthlyCorpStats,
+    MonthlyCorpTotals,
+    MonthlyCreatorStats,
+    MonthlyUserStats,
+    month_period,
+)
+
+ALLIANCE_ID = 1000
+
+
+def secondary_db(model):
+    """
+    Database alias the unmanaged AA models are read from
+
+    :return: alias
+    :rtype: str
+    """
+
+    return router.db_for_read(model)
+
+
+def create_secondary_tables():
+    """
+    Create the tables of the unmanaged AA models that don't exist yet,
+    Django doesn't create them for the tests
+
+    :return: the created models
+    :rtype: list
+    """
+
+    created = []
+    for model in apps.all_models["secondary_app"].values():
+        connection = connections[secondary_db(model)]
+        if model._meta.db_table in connection.introspection.table_names():
+            continue
+
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(model)
+        created.append(model)
+
+    return created
+
+
+def delete_secondary_tables(models):
+    """
+    Drop the tables created by create_secondary_tables
+
+    :param models: the created models
+    :type models: list
+    :return:
+    :rtype:
+    """
+
+    for model in models:
+        with connections[secondary_db(model)].schema_editor() as schema_editor:
+            schema_editor.delete_model(model)
+
+
+def create(model, **fields):
+    """
+    Create a row of an unmanaged AA model, the router doesn't allow writes
+
+    :return: the created object
+    """
+
+    return model.objects.using(secondary_db(model)).create(**fields)
+
+
+def eager_chord(header):
+    """
+    Stand-in for celery.chord, runs the header and body in-process
+    """
+
+    results = [signature.apply().get() for signature in header]
+
+    return lambda body: body.apply((results,)).get()
+
+
+def frozen_datetime(now):
+    """
+    Stand-in for datetime whose now() returns the given time
+    """
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    return FrozenDatetime
+
+
+def afat_stats(month, year):
+    """
+    The stored AFAT stats of a month, for comparing runs
+
+    :return: sorted rows of each stats table
+    :rtype: dict
+    """
+
+    return {
+        "users": sorted(
+            MonthlyUserStats.objects.filter(
+                month=month, year=year, fleet_type__source="afat"
+            ).values_list("user_id", "corporation_id", "fleet_type__name", "total_fats")
+        ),
+        "corps": sorted(
+            MonthlyCorpStats.objects.filter(
+                month=month, year=year, fleet_type__source="afat"
+            ).values_list("corporation_id", "fleet_type__name", "total_fats")
+        ),
+        "creators": sorted(
+            MonthlyCreatorStats.objects.filter(month=month, year=year).values_list(
+                "creator_id", "fleet_type__name", "total_created"
+            )
+        ),
+        "totals": sorted(
+            MonthlyCorpTotals.objects.filter(
+                period=month_period(month, year)
+            ).values_list("corporation_id", "source", "total_fats", "main_count")
+        ),
+        "watermark": list(
+            MonthlyAfatWatermark.objects.filter(month=month, year=year).values_list(
+                "last_fat_id", "last_fatlink_created"
+            )
+        ),
+    }
+
+
+@override_settings(STATS_ALLIANCE_ID=ALLIANCE_ID, STATS_IGNORE_CORPS=[])
+class AfatTestCase(TestCase):
+    """
+    AFAT data of 05/2024 in the unmanaged AA tables
+
+    User 1 has a main in corp 2001 and an alt in corp 2002, user 2 a main
+    in corp 2002. The main of user 3 is in a corp without corporation info,
+    the main of user 4 outside the alliance and character 51 has no owner.
+    Fleet 4 and the fat of character 12 on fleet 1 are added by
+    add_late_fleet, after a first run.
+    """
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """
+        Test setup
+        :return:
+        :rtype:
+        """
+
+        # Schema changes can't run in the transaction of the test case
+        cls.created_tables = create_secondary_tables()
+
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Test teardown
+        :return:
+        :rtype:
+        """
+
+        super().tearDownClass()
+
+        delete_secondary_tables(cls.created_tables)
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """
+        Test data
+        :return:
+        :rtype:
+        """
+
+        alliance = create(
+            EveonlineEveallianceinfo,
+            alliance_id=ALLIANCE_ID,
+            alliance_name="Lawn",
+            alliance_ticker="LAWN",
+            executor_corp_id=2001,
+        )
+        for corporation_id in (2001, 2002):
+            create(
+                EveonlineEvecorporationinfo,
+                corporation_id=corporation_id,
+                corporation_name=f"Corp {corporation_id}",
+                corporation_ticker=str(corporation_id),
+                member_count=10,
+                alliance=alliance,
+            )
+        state = create(AuthenticationState, name="Member", priority=100, public=0)
+        create(AfatFleettype, id=1, name="Strategic", is_enabled=1)
+        create(AfatFleettype, id=2, name="Peacetime", is_enabled=1)
+
+        # character: (user, corporation, alliance, main)
+        characters = {
+            11: (1, 2001, ALLIANCE_ID, True),
+            12: (1, 2002, ALLIANCE_ID, False),
+            21: (2, 2002, ALLIANCE_ID, True),
+            31: (3, 2003, ALLIANCE_ID, True),
+            41: (4, 3001, 2000, True),
+            51: (None, 2001, ALLIANCE_ID, False),
+        }
+        cls.users = {
+            user_id: create(
+                AuthUser,
+                id=user_id,
+                password="",
+                is_superuser=0,
+                username=f"user{user_id}",
+                first_name="",
+                last_name="",
+                email="",
+                is_staff=0,
+                is_active=1,
+                date_joined=datetime(2024, 1, 1),
+            )
+            for user_id in (1, 2, 3, 4)
+        }
+        cls.characters = {}
+        for character_id, (user_id, corporation_id, alliance_id, main) in sorted(
+            characters.items()
+        ):
+            character = create(
+                EveonlineEvecharacter,
+                id=character_id,
+                character_id=90000000 + character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=corporation_id,
+                corporation_name=f"Corp {corporation_id}",
+                corporation_ticker="CORP",
+                alliance_id=alliance_id,
+            )
+            cls.characters[character_id] = character
+            if user_id is None:
+                continue
+
+            create(
+                AuthenticationCharacterownership,
+                owner_hash=f"hash{character_id}",
+                character=character,
+                user=cls.users[user_id],
+            )
+            if main:
+                create(
+                    AuthenticationUserprofile,
+                    main_character=character,
+                    state=state,
+                    user=cls.users[user_id],
+                    language="en",
+                )
+
+        # fleet: (creator, fleet type, created, characters)
+        cls.create_fleets(
+            {
+                1: (1, 1, datetime(2024, 5, 3, 20), [11, 21, 31, 41, 51]),
+                2: (1, 2, datetime(2024, 5, 10, 20), [11, 21]),
+                3: (2, None, datetime(2024, 5, 17, 20), [12, 21]),
+                5: (1, 1, datetime(2024, 4, 28, 20), [11, 21]),
+            }
+        )
+
+    @classmethod
+    def create_fleets(cls, fleets):
+        """
+        Create fatlinks and their fats
+
+        :param fleets: {fatlink id: (creator, fleet type, created, characters)}
+        :type fleets: dict
+        :return:
+        :rtype:
+        """
+
+        for fatlink_id, (creator_id, link_type_id, created, fats) in fleets.items():
+            fatlink = create(
+                AfatFatlink,
+                id=fatlink_id,
+                created=created,
+                fleet=f"Fleet {fatlink_id}",
+                hash=f"fleet{fatlink_id}",
+                creator_id=creator_id,
+                link_type_id=link_type_id,
+                is_esilink=0,
+                is_registered_on_esi=0,
+                reopened=0,
+                esi_error_count=0,
+                last_esi_error="",
+            )
+            for character_id in fats:
+                create(AfatFat, character_id=character_id, fatlink=fatlink)
+
+    def add_late_fleet(self):
+        """
+        Add fleet 4 and a late fat on fleet 1
+        :return:
+        :rtype:
+        """
+
+        self.create_fleets({4: (2, 1, datetime(2024, 5, 25, 20), [11, 12, 21])})
+        create(AfatFat, character_id=12, fatlink_id=1)
+
+    def setUp(self) -> None:
+        """
+        Fresh caches and no chart rendering
+        :return:
+        :rtype:
+        """
+
+        cache.clear()
+        identity.invalidate()
+
+        patcher = mock.patch("lawn_stats.tasks.render_month_charts")
+        patcher.start()
+        self.addCleanup(patcher.stop)
@@ -0,0 +1,78 @@
+"""Temporary storage for uploaded CSV files"""
+
+import csv
+import io
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from allianceauth.services.hooks import get_extension_logger
+
+logger = get_extension_logger(__name__)
+
+UPLOAD_DIR = "lawn_stats/csv_uploads"
+
+
+def save_csv_upload(uploaded_file):
+    """
+    Store an uploaded CSV file until it is processed
+
+    The file is written in chunks, only the returned name is passed on to the
+    session and the processing task. Workers must share the default storage.
+
+    :return: storage name of the file
+    """
+    return default_storage.save(f"{UPLOAD_DIR}/{uuid.uuid4().hex}.csv", uploaded_file)
+
+
+@contextmanager
+def open_csv_upload(name):
+    """Open a stored CSV file as text, lines are read as they are needed"""
+    with default_storage.open(name, "rb") as stored_file:
+        yield io.TextIOWrapper(stored_file, encoding="utf-8", newline="")
+
+
+def read_csv_columns(name):
+    """Return the header row of a stored CSV file"""
+    with open_csv_upload(name) as csv_file:
+        return next(csv.reader(csv_file), [])
+
+
+def delete_csv_upload(name):
+    """Remove a stored CSV file, missing files are ignored"""
+    if name and default_storage.exists(name):
+        default_storage.delete(name)
+        logger.debug(f"Deleted CSV upload {name}")
+
+
+def delete_old_csv_uploads(max_age):
+    """
+    Remove stored CSV files older than max_age seconds
+
+    Uploads whose columns were never mapped are not processed, and so never
+    deleted, by the processing task.
+
+    :return: number of deleted files
+    """
+    try:
+        _, names = default_storage.listdir(UPLOAD_DIR)
+    except FileNotFoundError:
+        return 0
+
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    deleted = 0
+    for name in names:
+        path = f"{UPLOAD_DIR}/{name}"
+        try:
+            modified = default_storage.get_modified_time(path)
+        except (FileNotFoundError, NotImplementedError):
+            continue
+
+        if modified < cutoff:
+            delete_csv_upload(path)
+            deleted += 1
+
+    return deleted
@@ -8,6 +8,15 @@ urlpatterns = [
     path("upload_csv/", views.upload_csv, name="upload_csv"),
     path("map_columns/", views.map_columns, name="map_columns"),
     path("upload_afat_data/", views.upload_afat_data, name="upload_afat_data"),
-    path("creator_charts/", views.creator_charts, name="creator_charts"),
     path("all_charts/", views.all_charts, name="all_charts"),
+    path(
+        "charts/<int:year>/<int:month>/<str:section>/",
+        views.chart_section,
+        name="chart_section",
+    ),
+    path(
+        "charts/<int:year>/<int:month>/<str:section>/<str:chart>.png",
+        views.chart_image,
+        name="chart_image",
+    ),
 ]
@@ -10,7 +10,7 @@ Test settings
 
 from .base import *
 
-PACKAGE = "example"
+PACKAGE = "lawn_stats"
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.10/howto/static-files/